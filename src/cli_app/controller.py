@@ -1,48 +1,125 @@
+import json
 import os
+import time
+from urllib.parse import quote
+
+import jwt
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from rich.console import Console
+from rich.table import Table
 from rich.prompt import Confirm, Prompt
 
 from cli_app.views import ViewInput, ViewSelect, FIELDS_PROMPT
 
+PAGE_SIZE = 50
+# seconds to open the connection and to wait for the server response
+CONNECT_TIMEOUT = float(os.getenv("EPIC_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("EPIC_READ_TIMEOUT", 30))
+# retries with backoff (0.3s, 0.6s, 1.2s...) for GET only, every route that changes data is a POST and is not retried
+GET_RETRIES = int(os.getenv("EPIC_GET_RETRIES", 3))
+# seconds before the token expiration from which the session is checked by the server
+TOKEN_EXPIRY_MARGIN = 60
+
+
+def create_http_session() -> requests.Session:
+    retry = Retry(
+        total=GET_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET"],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 class APIBase:
+    # keep-alive connections shared by all the controllers
+    http = create_http_session()
 
     def __init__(self):
         self.base_url = "http://127.0.0.1:8000/"
         self.token_path = os.path.join(os.getcwd(), "token")
         self.console = Console()
         self.view = ViewInput()
+        # route -> (ETag, body) of the last list responses
+        self.etags = {}
+        # token file content, read once
+        self.token = None
 
     def request_api(self, route: str, data=None) -> dict | None:
         try:
             if token := self._get_token():
-                if data:
-                    response = requests.post(
+                if data is not None:
+                    response = self.http.post(
                         url=self.base_url + route,
                         json=data,
-                        headers={"Authorization": token}
+                        headers={"Authorization": token},
+                        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
                     )
                 else:
-                    response = requests.get(
+                    headers = {"Authorization": token}
+                    if cached := self.etags.get(route):
+                        headers["If-None-Match"] = cached[0]
+                    response = self.http.get(
                         url=self.base_url + route,
-                        headers={"Authorization": token}
+                        headers=headers,
+                        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
                     )
+                    if response.status_code == 304:
+                        # unchanged on the server, reuse the last body
+                        return json.loads(cached[1])
+                    if response.status_code == 200 and (tag := response.headers.get("ETag")):
+                        self.etags[route] = (tag, response.content)
 
                 if response.status_code == 200:
                     return response.json()
                 else:
-                    self.console.print(response.json().get("error"), style="red")
+                    self.console.print(self.error_message(response), style="red")
             else:
                 self.console.print("You need to log in", style="red")
+        except requests.exceptions.Timeout:
+            self.console.print("Server not responding", style="red")
         except requests.exceptions.ConnectionError:
             self.console.print("Server unavailable", style="red")
 
+    @staticmethod
+    def error_message(response: requests.Response) -> str:
+        # JSON error of the API, or the plain text of a server error page or a proxy
+        try:
+            return response.json().get("error")
+        except ValueError:
+            return f"{response.status_code} {response.text}"
+
+    def connection_stats(self) -> dict:
+        # urllib3 counts the requests and the connections opened by each pool
+        pools = self.http.get_adapter(self.base_url).poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        sent = sum(pool.num_requests for pool in pools)
+        opened = sum(pool.num_connections for pool in pools)
+        return {"requests": sent, "connections": opened, "reused": sent - opened}
+
+    def request_page(self, route: str, after=None) -> dict | None:
+        # request one page of a list route, next pages are loaded on scroll
+        params = f"limit={PAGE_SIZE}"
+        if after:
+            params += f"&after={after}"
+        separator = "&" if "?" in route else "?"
+        return self.request_api(route + separator + params)
+
+    def page_loader(self, route: str):
+        return lambda cursor: self.request_page(route, after=cursor)
+
     def user_perm(roles: list[str]):
         def decorator(func):
             def wrapper(self, *args, **kwargs):
-                response = self.request_api("/session")
+                response = self._local_session() or self.request_api("/session")
                 if response:
                     if response.get("role") in roles:
                         kwargs["user_role"] = response.get("role")
@@ -54,6 +131,10 @@ class APIBase:
         return decorator
 
     def update_input(self, route: str, data: dict, id: int) -> None:
+        title = list(data.keys())[0]
+        rows = data[title]
+        # edits are staged locally and sent in one request when the user is done
+        changes = {}
         loop = True
         while loop:
             select = ViewSelect(
@@ -66,27 +147,56 @@ class APIBase:
                 value = self.console.input(FIELDS_PROMPT.get(field[0]))
                 valid_value = self.view.check_input(field[0], value)
                 if valid_value is not None:
-                    res = self.request_api(
-                                f"{route}/update/{id}",
-                                data={field[0]: valid_value}
-                            )
+                    changes[field[0]] = valid_value
+                    row = next(row for row in data[title] if row.get("id") == id)
+                    data = {title: [{**row, field[0]: valid_value}]}
                 else:
                     self.console.print(f"Invalid input for field {field[0]}", style="red")
                 confirm = Confirm.ask("Update another field")
-                if confirm:
-                    res = self.request_api(route)
-                    if not res:
-                        loop = False
-                else:
+                if not confirm:
                     loop = False
             else:
                 loop = False
 
+        if changes:
+            res = self.request_api(f"{route}/update", data=[{"id": id, "changes": changes}])
+            if res:
+                for result in res["results"]:
+                    if result["status_code"] == 200:
+                        self.console.print(result["status"], style="green")
+                        # the row returned by the server replaces the displayed row
+                        if updated := result.get(title.removesuffix("s")):
+                            for idx, row in enumerate(rows):
+                                if row.get("id") == id:
+                                    rows[idx] = updated
+                            self.console.print(self._row_table(updated))
+                    else:
+                        self.console.print(result.get("error"), style="red")
+
+    @staticmethod
+    def _row_table(row: dict) -> Table:
+        table = Table()
+        table.add_column("Field")
+        table.add_column("Value")
+        for key, value in row.items():
+            table.add_row(key, str(value))
+        return table
+
     def _get_token(self) -> str | None:
-        if os.path.exists(self.token_path):
+        if self.token is None and os.path.exists(self.token_path):
             with open(self.token_path, mode="r") as file:
-                token = file.readline()
-            return token
+                self.token = file.readline()
+        return self.token
+
+    # role and id read in the stored token, the signature is checked by the server on each request
+    def _local_session(self) -> dict | None:
+        if token := self._get_token():
+            try:
+                payload = jwt.decode(token.split(" ")[1], options={"verify_signature": False})
+            except (jwt.InvalidTokenError, IndexError):
+                return None
+            if payload.get("exp", 0) - time.time() > TOKEN_EXPIRY_MARGIN:
+                return {"id": payload.get("id"), "role": payload.get("role")}
 
 
 class Collaborator(APIBase):
@@ -97,20 +207,28 @@ class Collaborator(APIBase):
     def login(self, email: str, password: str) -> None:
         try:
             url = self.base_url + "/login"
-            response = requests.post(url, json={"email": email, "password": password})
+            response = self.http.post(
+                url,
+                json={"email": email, "password": password},
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+            )
             if response.status_code == 200:
                 token = response.json().get("jwt_token")
                 with open(self.token_path, mode="w") as file:
                     file.write(token)
+                self.token = token
                 self.console.print(response.json().get("status"), style="green")
             else:
                 self.console.print(response.json().get("error"), style="red")
+        except requests.exceptions.Timeout:
+            self.console.print("Server not responding", style="red")
         except requests.exceptions.ConnectionError:
             self.console.print("Server unavailable", style="red")
 
     def logout(self) -> None:
         if os.path.exists(self.token_path):
             os.remove(self.token_path)
+        self.token = None
         self.console.print("Deconnected", style="green")
 
     def change_pwd(self):
@@ -134,11 +252,12 @@ class Collaborator(APIBase):
         if filter in self.role_filter:
             route += f"?role={filter}"
 
-        if collabs := self.request_api(route):
+        if collabs := self.request_page(route):
             if collabs.get("collaborators"):
                 select = ViewSelect(
                     collabs,
-                    msg="List of collaborators"
+                    msg="List of collaborators",
+                    load_page=self.page_loader(route)
                 )
                 select.live_show()
             else:
@@ -159,12 +278,13 @@ class Collaborator(APIBase):
 
         loop = True
         while loop:
-            collabs = self.request_api(route)
+            collabs = self.request_page(route)
             if collabs.get("collaborators"):
                 select = ViewSelect(
                     collabs,
                     msg="Select collaborator to update",
-                    select=True
+                    select=True,
+                    load_page=self.page_loader(route)
                 )
                 collab_id = select.live_show()
                 if collab_id:
@@ -182,18 +302,19 @@ class Collaborator(APIBase):
         if filter in self.role_filter:
             route += f"?role={filter}"
 
-        collabs = self.request_api(route)
+        collabs = self.request_page(route)
         if collabs.get("collaborators"):
             select = ViewSelect(
                 collabs,
                 msg="Select collaborator to update",
-                select=True
+                select=True,
+                load_page=self.page_loader(route)
             )
             collab_id = select.live_show()
             if collab_id:
                 confirm = Confirm.ask("Are you sure to delete this collaborator")
                 if confirm:
-                    response = self.request_api(f"/collab/delete/{str(collab_id)}")
+                    response = self.request_api(f"/collab/delete/{str(collab_id)}", data={})
                     if response:
                         self.console.print(response["status"], style="green")
                 else:
@@ -201,6 +322,54 @@ class Collaborator(APIBase):
         else:
             self.console.print("No collaborators", style="red")
 
+    @APIBase.user_perm(["gestion"])
+    def reassign_portfolio(self, filter=None, **kwargs) -> None:
+        route = "/collab?fields=id,name,email,role_id"
+        # optional filter by role
+        if filter in self.role_filter:
+            route += f"&role={filter}"
+
+        collabs = self.request_page(route)
+        if not collabs or not collabs.get("collaborators"):
+            self.console.print("No collaborators", style="red")
+            return
+        select = ViewSelect(
+            collabs,
+            msg="Select the collaborator whose portfolio is reassigned",
+            select=True,
+            load_page=self.page_loader(route)
+        )
+        if not (from_id := select.live_show()):
+            return
+        # the portfolio goes to a collaborator with the same role
+        role = next(collab["role_id"] for collab in collabs["collaborators"] if collab["id"] == from_id)
+        route = f"/collab?fields=id,name,email&role={role}"
+        targets = self.request_page(route)
+        if not targets or not targets.get("collaborators"):
+            self.console.print("No collaborators", style="red")
+            return
+        select = ViewSelect(
+            targets,
+            msg=f"Select the {role} receiving the clients, contracts and events",
+            select=True,
+            load_page=self.page_loader(route)
+        )
+        if not (to_id := select.live_show()):
+            return
+        if to_id == from_id:
+            self.console.print("Choose a different collaborator", style="red")
+            return
+        if Confirm.ask("Reassign all the clients, contracts and events of this collaborator"):
+            response = self.request_api("/collab/reassign", data={"from_id": from_id, "to_id": to_id})
+            if response:
+                self.console.print(
+                    f"{response['status']}: {response['clients']} clients, "
+                    f"{response['contracts']} contracts, {response['events']} events",
+                    style="green"
+                )
+        else:
+            self.console.print("operation canceled", style="red")
+
 
 class Client(APIBase):
     def __init__(self):
@@ -212,16 +381,26 @@ class Client(APIBase):
         if filter == "unassigned":
             route += "?unassigned"
 
-        if clients := self.request_api(route):
+        if clients := self.request_page(route):
             if clients.get("clients"):
                 select = ViewSelect(
                     clients,
-                    msg="List of clients"
+                    msg="List of clients",
+                    load_page=self.page_loader(route)
                 )
                 select.live_show()
             else:
                 self.console.print("No client", style="red")
 
+    def search_clients(self):
+        query = Prompt.ask("Search clients (name, company or email)")
+        if clients := self.request_api(f"/client/search?q={quote(query)}"):
+            if clients.get("clients"):
+                select = ViewSelect(clients, msg=f"Clients matching '{query}'")
+                select.live_show()
+            else:
+                self.console.print("No client found", style="red")
+
     @APIBase.user_perm(["commercial"])
     def create_client(self, **kwargs):
         input_data = self.view.creation_input("client", kwargs["user_role"])
@@ -234,26 +413,30 @@ class Client(APIBase):
         while loop:
             if kwargs["user_role"] == "commercial":
                 # filter only commercial client
-                clients = self.request_api(f"/client?commercial_id={kwargs['user_id']}")
+                route = f"/client?commercial_id={kwargs['user_id']}"
             elif kwargs["user_role"] == "gestion":
                 # filter only clients without an assigned commercial
-                clients = self.request_api("/client?unassigned")
+                route = "/client?unassigned&fields=id,name,email,company"
+            clients = self.request_page(route)
 
             if clients.get("clients"):
                 select = ViewSelect(
                     clients,
                     msg="Select client to update",
-                    select=True
+                    select=True,
+                    load_page=self.page_loader(route)
                 )
                 if client_id := select.live_show():
                     if kwargs["user_role"] == "commercial":
                         self.update_input(route="/client", data=clients, id=client_id)
                     elif kwargs["user_role"] == "gestion":
-                        commercials = self.request_api("/collab?role=commercial")
+                        route = "/collab?role=commercial&fields=id,name,email"
+                        commercials = self.request_page(route)
                         select = ViewSelect(
                             commercials,
                             msg="Select the commercial to assign to this client",
-                            select=True
+                            select=True,
+                            load_page=self.page_loader(route)
                         )
                         if commercial_id := select.live_show():
                             self.request_api(
@@ -279,11 +462,12 @@ class Contract(APIBase):
         if filter in self.filters:
             route += f"?{filter}"
 
-        if contracts := self.request_api(route):
+        if contracts := self.request_page(route):
             if contracts.get("contracts"):
                 select = ViewSelect(
                     contracts,
-                    msg="List of contract"
+                    msg="List of contract",
+                    load_page=self.page_loader(route)
                 )
                 select.live_show()
             else:
@@ -291,11 +475,13 @@ class Contract(APIBase):
 
     @APIBase.user_perm(["gestion"])
     def create_contract(self, **kwargs):
-        if clients := self.request_api("/client"):
+        route = "/client?fields=id,name,company,commercial"
+        if clients := self.request_page(route):
             select = ViewSelect(
                 clients,
                 msg="Select the client for the new contract",
-                select=True
+                select=True,
+                load_page=self.page_loader(route)
             )
             if client_id := select.live_show():
                 input_data = self.view.creation_input("contract", kwargs["user_role"])
@@ -310,15 +496,17 @@ class Contract(APIBase):
         while loop:
             # filter contracts only for commercial client, all for gestion
             if kwargs.get("user_role") == "commercial":
-                contracts = self.request_api(f"/contract?commercial_id={kwargs['user_id']}")
+                route = f"/contract?commercial_id={kwargs['user_id']}"
             elif kwargs.get("user_role") == "gestion":
-                contracts = self.request_api("/contract")
+                route = "/contract"
+            contracts = self.request_page(route)
 
             if contracts.get("contracts"):
                 select = ViewSelect(
                     contracts,
                     msg="Select contract to update",
-                    select=True
+                    select=True,
+                    load_page=self.page_loader(route)
                 )
                 if contract_id := select.live_show():
                     self.update_input(route="/contract", data=contracts, id=contract_id)
@@ -338,11 +526,12 @@ class Event(APIBase):
         if filter == "no_support":
             route += "?no_support"
 
-        if events := self.request_api(route):
+        if events := self.request_page(route):
             if events.get("events"):
                 select = ViewSelect(
                     events,
-                    msg="List of events"
+                    msg="List of events",
+                    load_page=self.page_loader(route)
                 )
                 select.live_show()
             else:
@@ -351,12 +540,14 @@ class Event(APIBase):
     @APIBase.user_perm(["commercial"])
     def create_event(self, **kwargs):
         # filter only contract for commercial client
-        if contracts := self.request_api(f"/contract?commercial_id={kwargs['user_id']}"):
+        route = f"/contract?commercial_id={kwargs['user_id']}&fields=id,client,event_title,date"
+        if contracts := self.request_page(route):
             if contracts.get("contracts"):
                 select = ViewSelect(
                     contracts,
                     msg="Select contact for this event",
-                    select=True
+                    select=True,
+                    load_page=self.page_loader(route)
                 )
                 if contract_id := select.live_show():
                     input_data = self.view.creation_input("event", kwargs["user_role"])
@@ -374,19 +565,23 @@ class Event(APIBase):
         if kwargs["user_role"] == "gestion":
             while loop:
                 # filter only event with no support and collaborator with support role
-                events = self.request_api("/event?no_support")
-                supports = self.request_api("/collab?role=support")
+                events_route = "/event?no_support&fields=id,client,title,event_start,event_end,location"
+                supports_route = "/collab?role=support&fields=id,name,email"
+                events = self.request_page(events_route)
+                supports = self.request_page(supports_route)
                 if events.get("events") and supports.get("collaborators"):
                     select = ViewSelect(
                         events,
                         msg="Select event to update",
-                        select=True
+                        select=True,
+                        load_page=self.page_loader(events_route)
                     )
                     event_id = select.live_show()
                     select = ViewSelect(
                         supports,
                         msg="Select support for this event",
-                        select=True
+                        select=True,
+                        load_page=self.page_loader(supports_route)
                     )
                     support_id = select.live_show()
                     if event_id and support_id:
@@ -402,12 +597,14 @@ class Event(APIBase):
         elif kwargs["user_role"] == "support":
             while loop:
                 # filter only support user event
-                events = self.request_api(f"/event?support_id={kwargs['user_id']}")
+                route = f"/event?support_id={kwargs['user_id']}"
+                events = self.request_page(route)
                 if events.get("events"):
                     select = ViewSelect(
                         events,
                         msg="Select event to update",
-                        select=True
+                        select=True,
+                        load_page=self.page_loader(route)
                     )
                     if event_id := select.live_show():
                         self.update_input(route="/event", data=events, id=event_id)
@@ -416,3 +613,104 @@ class Event(APIBase):
                 else:
                     self.console.print("No event assigned", style="red")
                     loop = False
+
+
+class Transfer(APIBase):
+    # file content types accepted by the import routes
+    content_types = {
+        ".csv": "text/csv",
+        ".ndjson": "application/x-ndjson",
+        ".jsonl": "application/x-ndjson"
+    }
+
+    def import_file(self, resource: str, path: str) -> None:
+        content_type = self.content_types.get(os.path.splitext(path)[1].lower())
+        if content_type is None:
+            self.console.print("File must be .csv, .ndjson or .jsonl", style="red")
+            return
+        if not (token := self._get_token()):
+            self.console.print("You need to log in", style="red")
+            return
+        try:
+            # the file is streamed in the request body, not read in memory
+            with open(path, mode="rb") as file:
+                response = self.http.post(
+                    url=self.base_url + f"/{resource}/import",
+                    data=file,
+                    headers={"Authorization": token, "Content-Type": content_type},
+                    timeout=(CONNECT_TIMEOUT, None)
+                )
+        except requests.exceptions.ConnectionError:
+            self.console.print("Server unavailable", style="red")
+            return
+
+        if response.status_code != 200:
+            self.console.print(self.error_message(response), style="red")
+            return
+        result = response.json()
+        self.console.print(f"{result['inserted']} {resource}(s) imported", style="green")
+        if result["error_count"]:
+            self.console.print(f"{result['error_count']} line(s) rejected", style="red")
+            for error in result["errors"]:
+                self.console.print(f"line {error['line']}: {error['error']}")
+
+    def export_file(self, resource: str, path: str, filters: tuple[str, ...] = ()) -> None:
+        if not (token := self._get_token()):
+            self.console.print("You need to log in", style="red")
+            return
+        route = f"/export/{resource}"
+        if filters:
+            route += "?" + "&".join(filters)
+        try:
+            # written chunk by chunk as the server streams the CSV
+            with self.http.get(
+                url=self.base_url + route,
+                headers={"Authorization": token},
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    self.console.print(self.error_message(response), style="red")
+                    return
+                with open(path, mode="wb") as file:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        file.write(chunk)
+        except requests.exceptions.ChunkedEncodingError:
+            # the server aborted the stream on an error, the file would be incomplete
+            os.remove(path)
+            self.console.print("Export interrupted, no file written", style="red")
+            return
+        except requests.exceptions.Timeout:
+            self.console.print("Server not responding", style="red")
+            return
+        except requests.exceptions.ConnectionError:
+            self.console.print("Server unavailable", style="red")
+            return
+        self.console.print(f"{resource}s exported to {path}", style="green")
+
+
+class Stats(APIBase):
+    # columns of the dashboard tables, the numbers are computed by the server
+    commercial_columns = ["name", "outstanding", "debtor_contracts", "unsigned_contracts", "events_without_support"]
+    support_columns = ["name", "upcoming_events"]
+
+    @APIBase.user_perm(["gestion"])
+    def show(self, **kwargs) -> None:
+        if stats := self.request_api("/stats"):
+            self.console.print(self._table("Commercials", self.commercial_columns, stats["commercials"]))
+            self.console.print(self._table("Supports", self.support_columns, stats["supports"]))
+            totals = stats["totals"]
+            self.console.print(
+                f"Outstanding: {totals['outstanding']} | Unsigned contracts: {totals['unsigned_contracts']} | "
+                f"Events without support: {totals['events_without_support']}",
+                style="bold"
+            )
+
+    @staticmethod
+    def _table(title: str, columns: list[str], rows: list[dict]) -> Table:
+        table = Table(title=f" {title}", title_justify="left", title_style="black on green")
+        for column in columns:
+            table.add_column(column.replace("_", " "), justify="left" if column == "name" else "right")
+        for row in rows:
+            table.add_row(*[str(row[column]) for column in columns])
+        return table
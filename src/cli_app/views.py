@@ -1,12 +1,18 @@
 import re
+import time
+from bisect import bisect_left
 
 from rich.table import Table
 from rich.console import Console
 
+from shared.schemas import parse_input
+
 from platform import system
 if system() == 'Windows':
-    from msvcrt import getch
+    from msvcrt import getch, kbhit
 else:
+    import sys
+    from select import select as wait_readable
     from getch import getch
 
 ROLE_FIELDS = {
@@ -65,63 +71,231 @@ class ViewInput:
         return data
 
     def check_input(self, field: str, value: str):
-        if field in ["attendees", "total_cost", "remaining_to_pay"]:
-            if value.isdigit():
-                return int(value)
-        elif field == "phone":
-            if value.isdigit():
-                return value
-        elif field == "password":
-            if len(value) >= 6:
-                return value
-        elif field == "status":
-            if value == "0":
+        # same rules as the API, None when the value is invalid
+        try:
+            return parse_input(field, value)
+        except ValueError:
+            return None
+
+
+# lines used around the table: header, commands, table title, borders, column names and caption
+SCREEN_MARGIN = 14
+
+# escape sequences (Linux, macOS) and two-byte codes (Windows) of the navigation keys
+SPECIAL_KEYS = {
+    "[A": "up", "[B": "down", "[5~": "page_up", "[6~": "page_down",
+    "[H": "home", "[F": "end", "[1~": "home", "[4~": "end",
+    "H": "up", "P": "down", "I": "page_up", "Q": "page_down", "G": "home", "O": "end"
+}
+
+# words of the cells indexed for the search
+TOKEN_PATTERN = re.compile(r"\w+")
+NUMBER_PATTERN = re.compile(r"^-?\d+(\.\d+)?$")
+DATE_PATTERN = re.compile(r"^(\d{2})[/-](\d{2})[/-](\d{4})(.*)$")
+
+# seconds to wait for the rest of an escape sequence, a lone Esc returns after this delay
+ESCAPE_TIMEOUT = 0.1
+
+
+def key_pending() -> bool:
+    # the characters of an escape sequence arrive together, nothing after Esc means the Esc key
+    if system() == 'Windows':
+        deadline = time.monotonic() + ESCAPE_TIMEOUT
+        while not kbhit():
+            if time.monotonic() > deadline:
                 return False
-            elif value == "1":
-                return True
-        elif field == "role_id":
-            if value in ["1", "2", "3"]:
-                return int(value)
-        elif field == "date":
-            pattern = r"^(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/\d{4}$"
-            if re.match(pattern, value):
-                return value
-        elif field in ["event_start", "event_end"]:
-            pattern = r"^(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/(20[2-9][0-9]) ([01][0-9]|2[0-3]):([0-5][0-9])$"
-            if re.match(pattern, value):
-                return value
-        elif field == "email":
-            pattern = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
-            if re.match(pattern, value):
-                return value
-        else:
-            return value
+            time.sleep(0.01)
+        return True
+    return bool(wait_readable([sys.stdin], [], [], ESCAPE_TIMEOUT)[0])
+
+
+def read_char() -> str:
+    # msvcrt returns bytes
+    char = getch()
+    return char.decode("latin-1") if isinstance(char, bytes) else char
+
+
+def read_key() -> str:
+    key = getch()
+    if isinstance(key, bytes):
+        if key in [b"\xe0", b"\x00"]:
+            return SPECIAL_KEYS.get(getch().decode("latin-1"), "")
+        key = key.decode("latin-1")
+    if key == "\x1b":
+        if not key_pending():
+            return "escape"
+        sequence = read_char()
+        if sequence != "[":
+            return "escape"
+        sequence += read_char()
+        # page up/down, home/end: one more character
+        if sequence[-1].isdigit():
+            sequence += read_char()
+        return SPECIAL_KEYS.get(sequence, "")
+    return key
+
+
+def sort_key(value: str) -> tuple:
+    # numbers and dates (dd/mm/yyyy) sorted by value, other cells alphabetically
+    if NUMBER_PATTERN.match(value):
+        return (0, float(value), "")
+    date = DATE_PATTERN.match(value)
+    if date:
+        day, month, year, rest = date.groups()
+        return (1, 0, f"{year}{month}{day}{rest}")
+    return (2, 0, value.lower())
 
 
 class ViewSelect:
 
-    def __init__(self, data: dict, msg: str, select=False, update=False) -> None:
+    def __init__(self, data: dict, msg: str, select=False, update=False, load_page=None) -> None:
         self.title = list(data.keys())[0]
         self.data = data[self.title]
+        # optional callable loading the page after a cursor when scrolling
+        self.load_page = load_page
+        self.next_cursor = data.get("next_cursor")
         self.msg = msg
         self.update = update
         self.select = select if not update else True
         self.pointer = 0
+        # first row shown in the viewport
+        self.offset = 0
         self.console = Console()
+        # cells converted to strings once, only the rows of the viewport are rendered
+        self.columns = list(self.data[0].keys()) if self.data and not update else []
+        self.cells = []
+        self.id_index = {}
+        # search and sort: token -> rows index and sort orders are built once per dataset,
+        # visible holds the indices of the rows shown, the pointer is a position in it
+        self.tokens = {}
+        self.sorted_tokens = None
+        self.orders = {}
+        self.visible = []
+        self.query = ""
+        self.searching = False
+        self.sort_column = None
+        self.sort_desc = False
+        if not update:
+            self._add_rows(self.data)
+
+    def _add_rows(self, rows: list) -> None:
+        for row in rows:
+            idx = len(self.cells)
+            cells = tuple(str(value) for value in row.values())
+            self.id_index[row.get("id")] = idx
+            self.cells.append(cells)
+            for token in TOKEN_PATTERN.findall(" ".join(cells).lower()):
+                self.tokens.setdefault(token, set()).add(idx)
+        # the sorted tokens and the sort orders are built again on the next search or sort
+        self.sorted_tokens = None
+        self.orders = {}
+        self._refresh()
+
+    def _matches(self) -> set | None:
+        # rows having a token starting with each word of the query, None without query
+        words = TOKEN_PATTERN.findall(self.query.lower())
+        if not words:
+            return None
+        if self.sorted_tokens is None:
+            self.sorted_tokens = sorted(self.tokens)
+        matches = None
+        for word in words:
+            rows = set()
+            # the tokens starting with the word follow each other in the sorted list
+            idx = bisect_left(self.sorted_tokens, word)
+            while idx < len(self.sorted_tokens) and self.sorted_tokens[idx].startswith(word):
+                rows |= self.tokens[self.sorted_tokens[idx]]
+                idx += 1
+            matches = rows if matches is None else matches & rows
+        return matches
+
+    def _order(self) -> tuple[list, list]:
+        # rows sorted on the sort column and the rank of each row, computed once per column
+        if self.sort_column not in self.orders:
+            order = sorted(range(len(self.cells)), key=lambda idx: sort_key(self.cells[idx][self.sort_column]))
+            rank = [0] * len(order)
+            for position, idx in enumerate(order):
+                rank[idx] = position
+            self.orders[self.sort_column] = order, rank
+        return self.orders[self.sort_column]
+
+    def _refresh(self) -> None:
+        matches = self._matches()
+        if self.sort_column is None:
+            self.visible = sorted(matches) if matches is not None else list(range(len(self.cells)))
+        else:
+            order, rank = self._order()
+            self.visible = sorted(matches, key=rank.__getitem__) if matches is not None else list(order)
+            if self.sort_desc:
+                self.visible.reverse()
+        self.pointer = min(self.pointer, max(len(self.visible) - 1, 0))
+
+    def _next_sort(self) -> None:
+        # no sort -> first column ascending -> descending -> next column ... -> no sort
+        if self.sort_column is None:
+            self.sort_column, self.sort_desc = 0, False
+        elif not self.sort_desc:
+            self.sort_desc = True
+        elif self.sort_column + 1 < len(self.columns):
+            self.sort_column, self.sort_desc = self.sort_column + 1, False
+        else:
+            self.sort_column, self.sort_desc = None, False
+        self.pointer = 0
+        self._refresh()
+
+    def _search_key(self, key: str) -> bool:
+        # return False for the navigation keys, still usable while typing
+        if key in ["\r", "\n"]:
+            self.searching = False
+            return True
+        if key == "escape":
+            self.searching = False
+            self.query = ""
+        elif key in ["\x7f", "\x08"]:
+            self.query = self.query[:-1]
+        elif len(key) == 1 and key.isprintable():
+            self.query += key
+        else:
+            return False
+        self.pointer = 0
+        self._refresh()
+        return True
+
+    def _row_count(self) -> int:
+        return len(self.data) if self.update else len(self.visible)
+
+    def _viewport_height(self) -> int:
+        return max(self.console.size.height - SCREEN_MARGIN, 3)
+
+    def _move_viewport(self, height: int) -> None:
+        # keep the pointer inside the window
+        if self.pointer < self.offset:
+            self.offset = self.pointer
+        elif self.pointer >= self.offset + height:
+            self.offset = self.pointer - height + 1
 
     def _create_table(self) -> Table:
+        height = self._viewport_height()
+        self._move_viewport(height)
+        end = min(self.offset + height, len(self.visible))
+        caption = f"rows {min(self.offset + 1, end)}-{end} of {len(self.visible)}"
+        if self.query:
+            caption += f" matching '{self.query}' ({len(self.cells)} loaded)"
         table = Table(
             title=f" {self.title.capitalize()}",
             title_justify="left",
-            title_style="black on green"
+            title_style="black on green",
+            caption=caption + (" | ↓ more rows" if self.next_cursor else "")
         )
-        for key in list(self.data[0].keys()):
-            table.add_column(key)
+        for column, key in enumerate(self.columns):
+            if column == self.sort_column:
+                key += " ▼" if self.sort_desc else " ▲"
+            table.add_column(key, no_wrap=True, overflow="ellipsis")
 
-        for idx, line in enumerate(self.data):
+        for position in range(self.offset, end):
             table.add_row(
-                *[str(value) for value in line.values()],
-                style="on blue" if idx == self.pointer else ""
+                *self.cells[self.visible[position]],
+                style="on blue" if position == self.pointer else ""
             )
         return table
 
@@ -137,6 +311,26 @@ class ViewSelect:
             )
         return table
 
+    def _load_next_page(self) -> bool:
+        if self.load_page and self.next_cursor:
+            page = self.load_page(self.next_cursor)
+            if page and page.get(self.title):
+                self.data.extend(page[self.title])
+                if not self.update:
+                    self._add_rows(page[self.title])
+                self.next_cursor = page.get("next_cursor")
+                return True
+        return False
+
+    def _jump_to_id(self) -> None:
+        value = self.console.input("Go to id: ")
+        if value.isdigit() and int(value) in self.id_index:
+            try:
+                self.pointer = self.visible.index(self.id_index[int(value)])
+            except ValueError:
+                # row filtered out by the search
+                pass
+
     def _header(self) -> None:
         self.console.clear()
         self.console.print(
@@ -145,11 +339,12 @@ class ViewSelect:
             justify="center"
         )
         validation = "| Enter : ⏎ valid " if self.select else ""
-        self.console.print(
-            f" Commands   a : ↑ up | w : ↓ down {validation}| q: quit",
-            style="black on blue",
-            justify="center"
-        )
+        pages = "| PgUp/PgDn : page | Home/End | g : go to id | / : search | s : sort " if not self.update else ""
+        if self.searching:
+            commands = f" Search: {self.query}▌   Enter : ⏎ keep filter | Esc : clear | ↑ ↓ : move"
+        else:
+            commands = f" Commands   a : ↑ up | w : ↓ down {pages}{validation}| q: quit"
+        self.console.print(commands, style="black on blue", justify="center")
         self.console.print("\n\n")
 
     def live_show(self, id=None) -> int:
@@ -159,37 +354,63 @@ class ViewSelect:
                     self.data = [item for item in row.items() if item[0] in FIELDS_PROMPT.keys()]
                     break
 
-        data_len = len(self.data) - 1
         loop = True
         while loop:
+            data_len = self._row_count() - 1
             self._header()
             if self.update:
                 self.console.print(self._create_item_table())
             else:
                 self.console.print(self._create_table())
-            key = getch()
+            key = read_key()
+            if self.searching and self._search_key(key):
+                continue
             match key:
-                case b"a" | "a":  # keyboard UP
+                case "a" | "up":  # keyboard UP
                     if self.pointer == 0:
-                        self.pointer = data_len
+                        self.pointer = max(data_len, 0)
                     else:
                         self.pointer -= 1
 
-                case b"w" | "w":  # keyboard DOWN
-                    if self.pointer == data_len:
+                case "w" | "down":  # keyboard DOWN
+                    if self.pointer >= data_len and not self._load_next_page():
                         self.pointer = 0
                     else:
-                        self.pointer += 1
+                        # rows of a new page may all be filtered out
+                        self.pointer = min(self.pointer + 1, max(self._row_count() - 1, 0))
+
+                case "page_up" if not self.update:
+                    self.pointer = max(self.pointer - self._viewport_height(), 0)
+
+                case "page_down" if not self.update:
+                    if self.pointer + self._viewport_height() > data_len:
+                        self._load_next_page()
+                    self.pointer = min(self.pointer + self._viewport_height(), max(self._row_count() - 1, 0))
+
+                case "home" if not self.update:
+                    self.pointer = 0
+
+                case "end" if not self.update:
+                    self.pointer = max(data_len, 0)
+
+                case "g" if not self.update:
+                    self._jump_to_id()
+
+                case "/" if not self.update:
+                    self.searching = True
+
+                case "s" if not self.update and self.columns:
+                    self._next_sort()
 
-                case b"\r" | "\n":  #  keyboard Enter
+                case "\r" | "\n":  #  keyboard Enter
                     if self.select:
                         if self.update:
                             return self.data[self.pointer]
-                        else:
-                            item_id = self.data[self.pointer].get("id")
+                        elif self.visible:
+                            item_id = self.data[self.visible[self.pointer]].get("id")
                             return int(item_id)
 
-                case b"q" | "q":  # keyboard q quit
+                case "q":  # keyboard q quit
                     return None
                 case _:
                     pass
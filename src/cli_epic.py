@@ -2,18 +2,23 @@ import click
 from rich.prompt import Prompt
 from rich.console import Console
 
-from cli_app.controller import Collaborator, Client, Contract, Event
+from cli_app.controller import Collaborator, Client, Contract, Event, Transfer, Stats
 
 console = Console()
 collaborator_ctl = Collaborator()
 client_ctl = Client()
 contract_ctl = Contract()
 event_ctl = Event()
+transfer_ctl = Transfer()
+stats_ctl = Stats()
 
 
 @click.group()
-def cli():
-    pass
+@click.option("--stats", is_flag=True, help="Show the HTTP connections reused by the command")
+@click.pass_context
+def cli(ctx, stats):
+    if stats:
+        ctx.call_on_close(lambda: console.print(collaborator_ctl.connection_stats()))
 
 
 @click.command()
@@ -37,9 +42,10 @@ def password():
 @click.option("-c", "--create", is_flag=True, help="Create new collaborator")
 @click.option("-u", "--update", is_flag=True, help="Update a collaborator")
 @click.option("-d", "--delete", is_flag=True, help="Delete a collaborator")
+@click.option("-r", "--reassign", is_flag=True, help="Move the clients, contracts and events of a collaborator to another")
 @click.option("-f", "--filter", type=str, help="filter by role -> gestion, commercial or support")
-def collab(create, update, delete, filter):
-    options_selected = sum([create, update, delete])
+def collab(create, update, delete, reassign, filter):
+    options_selected = sum([create, update, delete, reassign])
 
     if options_selected == 0:
         collaborator_ctl.get_list(filter=filter)
@@ -51,6 +57,8 @@ def collab(create, update, delete, filter):
             collaborator_ctl.update_collab(filter=filter)
         elif delete:
             collaborator_ctl.delete_collab(filter=filter)
+        elif reassign:
+            collaborator_ctl.reassign_portfolio(filter=filter)
     else:
         console.print("Multiple options not allowed", style="red")
 
@@ -59,8 +67,9 @@ def collab(create, update, delete, filter):
 @click.option("-c", "--create", is_flag=True, help="Create new client")
 @click.option("-u", "--update", is_flag=True, help="Update a client")
 @click.option("-f", "--filter", is_flag=True, help="filter clients without an assigned commercial")
-def client(create, update, filter):
-    options_selected = sum([create, update])
+@click.option("-s", "--search", is_flag=True, help="Search clients by name, company or email")
+def client(create, update, filter, search):
+    options_selected = sum([create, update, search])
 
     if options_selected == 0:
         client_ctl.get_list(filter=filter)
@@ -70,6 +79,8 @@ def client(create, update, filter):
             client_ctl.create_client()
         elif update:
             client_ctl.update_client()
+        elif search:
+            client_ctl.search_clients()
     else:
         console.print("Multiple options not allowed", style="red")
 
@@ -112,7 +123,30 @@ def event(create, update, filter):
         console.print("Multiple options not allowed", style="red")
 
 
-commands = [login, logout, password, collab, client, contract, event]
+@click.command(name="import", help="Import clients, contracts or events from a CSV (with header) or NDJSON file")
+@click.argument("resource", type=click.Choice(["client", "contract", "event"]))
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+def import_file(resource, file):
+    transfer_ctl.import_file(resource, file)
+
+
+@click.command(help="Export clients, contracts or events to a CSV file")
+@click.argument("resource", type=click.Choice(["client", "contract", "event"]))
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="CSV file, default: <resource>s.csv")
+@click.option(
+    "-f", "--filter", "filters", multiple=True,
+    help="list filter, repeatable -> unassigned, no_signed, debtor, no_support, commercial_id=<id>, support_id=<id>"
+)
+def export(resource, output, filters):
+    transfer_ctl.export_file(resource, output or f"{resource}s.csv", filters)
+
+
+@click.command(name="stats", help="Dashboard: amounts and counts per commercial and support, computed by the server")
+def dashboard():
+    stats_ctl.show()
+
+
+commands = [login, logout, password, collab, client, contract, event, import_file, export, dashboard]
 
 for command in commands:
     cli.add_command(command)
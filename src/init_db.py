@@ -1,4 +1,13 @@
+import sys
+
 from server.db_manager import DBManager
 
 db = DBManager()
-db.init_database()
+# python init_db.py --indexes: add the missing indexes on the existing database
+if "--indexes" in sys.argv:
+    db.create_indexes()
+# python init_db.py --balances: recompute the contract balances per commercial and per client
+elif "--balances" in sys.argv:
+    db.rebuild_balances()
+else:
+    db.init_database()
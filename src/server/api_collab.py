@@ -1,6 +1,8 @@
 import datetime
 
-from sqlalchemy import select
+from sqlalchemy import Select, select, update, delete, exists, or_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 from starlette.routing import Route
 from starlette.requests import Request
@@ -9,11 +11,27 @@ import jwt
 from sentry_sdk import capture_message
 
 from server.config import SECRET_KEY
-from server.models import Collaborator, Role
+from server.models import Collaborator, Role, Client, Contract, Event, CommercialBalance
 from server.permissions import handle_db_errors, check_permission_and_data
+from server.hashing import hash_password, verify_password
+from server.pagination import paginate, split_page
+from server.streaming import wants_stream, ndjson_response
+from server.projection import requested_fields, projection_response
+from server.cache import cached_response, invalidate_cache
+from server.batch import batch_update
+from server.rollups import BALANCE_COLUMNS, update_balances
+from shared.schemas import is_positive_int
 
 
 class CollabAPI:
+    # columns for ?fields= projection, formatted like serialize()
+    projection = {
+        "id": Collaborator.id,
+        "name": Collaborator.name,
+        "email": Collaborator.email,
+        "phone": Collaborator.phone,
+        "role_id": select(Role.role).where(Role.id == Collaborator.role_id).correlate(Collaborator).scalar_subquery()
+    }
 
     @classmethod
     def get_routes(cls) -> list[Route]:
@@ -22,44 +40,51 @@ class CollabAPI:
             Route('/change_pwd', cls.change_pwd, methods=["POST"]),
             Route('/session', cls.session, methods=["GET"]),
             Route('/collab', cls.get_collaborators, methods=["GET"]),
+            Route('/collab/{id:int}', cls.get_collaborator, methods=["GET"]),
             Route('/collab/create', cls.create_collaborator, methods=["POST"]),
-            Route('/collab/update/{id}', cls.update_collaborator, methods=["POST"]),
-            Route('/collab/delete/{id}', cls.delete_collaborator, methods=["GET"])
+            Route('/collab/update', cls.update_collaborators, methods=["POST"]),
+            Route('/collab/update/{id:int}', cls.update_collaborator, methods=["POST"]),
+            Route('/collab/reassign', cls.reassign_portfolio, methods=["POST"]),
+            Route('/collab/delete/{id:int}', cls.delete_collaborator, methods=["POST"])
         ]
 
     @staticmethod
     @handle_db_errors
     async def login(request: Request) -> JSONResponse:
         data = await request.json()
-        stmt = select(Collaborator).where(Collaborator.email == data.get("email"))
-        with request.state.db.begin() as session:
-            collab = session.scalar(stmt)
-            if collab:
-                # check password
-                try:
-                    ph = argon2.PasswordHasher()
-                    ph.verify(collab.password, data.get("password"))
-                except argon2.exceptions.VerificationError:
-                    return JSONResponse({"error": "Invalid password !"}, status_code=400)
-                else:
-                    # create jwt token
-                    token = jwt.encode(
-                        {
-                            "id": collab.id,
-                            "name": collab.name,
-                            "role": collab.role.__str__(),
-                            "exp": datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(hours=1)
-                        },
-                        SECRET_KEY,
-                        algorithm="HS256"
-                    )
-                    return JSONResponse(
-                        {
-                            "status": "Connected",
-                            "jwt_token": "Bearer " + token
-                        }
-                    )
-            return JSONResponse({"error": "email invalid !"}, status_code=400)
+        stmt = (
+            select(Collaborator)
+            .options(joinedload(Collaborator.role))
+            .where(Collaborator.email == data.get("email"))
+        )
+        async with request.state.db.begin() as session:
+            collab = await session.scalar(stmt)
+        # the connection is released before the password check
+        if collab:
+            # check password
+            try:
+                await verify_password(collab.password, data.get("password"))
+            except argon2.exceptions.VerificationError:
+                return JSONResponse({"error": "Invalid password !"}, status_code=400)
+            else:
+                # create jwt token
+                token = jwt.encode(
+                    {
+                        "id": collab.id,
+                        "name": collab.name,
+                        "role": collab.role.__str__(),
+                        "exp": datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(hours=1)
+                    },
+                    SECRET_KEY,
+                    algorithm="HS256"
+                )
+                return JSONResponse(
+                    {
+                        "status": "Connected",
+                        "jwt_token": "Bearer " + token
+                    }
+                )
+        return JSONResponse({"error": "email invalid !"}, status_code=400)
 
     @staticmethod
     @handle_db_errors
@@ -67,13 +92,12 @@ class CollabAPI:
         data = await request.json()
         password = data.get("password")
         if len(password) >= 6:
-            ph = argon2.PasswordHasher()
-            hached_pwd = ph.hash(password)
+            hached_pwd = await hash_password(password)
             user_id = request.state.jwt_payload.get("id")
 
             stmt = select(Collaborator).where(Collaborator.id == user_id)
-            with request.state.db.begin() as session:
-                user = session.scalar(stmt)
+            async with request.state.db.begin() as session:
+                user = await session.scalar(stmt)
                 user.password = hached_pwd
             return JSONResponse({"status": "Password updated"})
         else:
@@ -92,26 +116,56 @@ class CollabAPI:
 
     @staticmethod
     @handle_db_errors
+    @cached_response(Collaborator, Role)
     async def get_collaborators(request: Request) -> JSONResponse:
         stmt = select(Collaborator)
         if role := request.query_params.get("role"):
             stmt = stmt.join(Role).filter(Role.role == role)
-        with request.state.db.begin() as session:
-            data = session.scalars(stmt).all()
-            collaborators = [
-                {
-                    "id": collab.id,
-                    "name": collab.name,
-                    "email": collab.email,
-                    "phone": collab.phone,
-                    "role_id": collab.role.__str__()
-                }
-                for collab in data
-            ]
-        return JSONResponse({'collaborators': collaborators})
+        stmt, limit = paginate(stmt, Collaborator.id, request.query_params)
+        if fields := requested_fields(request, CollabAPI.projection):
+            return await projection_response(request, stmt, CollabAPI.projection, fields, "collaborators", limit)
+
+        stmt = stmt.options(joinedload(Collaborator.role))
+        if wants_stream(request):
+            return ndjson_response(request, stmt.limit(limit), CollabAPI.serialize)
+        async with request.state.db.begin() as session:
+            data, next_cursor = split_page((await session.scalars(stmt)).all(), limit)
+            collaborators = [CollabAPI.serialize(collab) for collab in data]
+        return JSONResponse({'collaborators': collaborators, 'next_cursor': next_cursor})
+
+    @staticmethod
+    @handle_db_errors
+    @cached_response(Collaborator, Role)
+    async def get_collaborator(request: Request) -> JSONResponse:
+        async with request.state.db.begin() as session:
+            collab = await session.scalar(CollabAPI.select_one(request.path_params["id"]))
+            if collab:
+                return JSONResponse({"collaborator": CollabAPI.serialize(collab)})
+        return JSONResponse({"error": "Invalid collaborator id"}, status_code=404)
+
+    @staticmethod
+    def select_one(collab_id: int) -> Select:
+        # populate_existing: also reloads a collaborator just updated in the session
+        return (
+            select(Collaborator)
+            .where(Collaborator.id == collab_id)
+            .options(joinedload(Collaborator.role))
+            .execution_options(populate_existing=True)
+        )
+
+    @staticmethod
+    def serialize(collab: Collaborator) -> dict:
+        return {
+            "id": collab.id,
+            "name": collab.name,
+            "email": collab.email,
+            "phone": collab.phone,
+            "role_id": collab.role.__str__()
+        }
 
     @staticmethod
     @handle_db_errors
+    @invalidate_cache(Collaborator)
     async def create_collaborator(request: Request) -> JSONResponse:
         user_role = request.state.jwt_payload.get("role")
         data = await request.json()
@@ -121,11 +175,10 @@ class CollabAPI:
             if cleaned_data.get("error"):
                 return JSONResponse(cleaned_data, status_code=400)
 
-            ph = argon2.PasswordHasher()
-            cleaned_data["password"] = ph.hash(cleaned_data["password"])
+            cleaned_data["password"] = await hash_password(cleaned_data["password"])
             new_collab = Collaborator(**cleaned_data)
 
-            with request.state.db.begin() as session:
+            async with request.state.db.begin() as session:
                 session.add(new_collab)
                 return JSONResponse({"status": "New collaborator created"})
         else:
@@ -133,41 +186,124 @@ class CollabAPI:
 
     @staticmethod
     @handle_db_errors
+    @invalidate_cache(Collaborator)
     async def update_collaborator(request: Request) -> JSONResponse:
-        user_role = request.state.jwt_payload.get("role")
         data = await request.json()
-        cleaned_data = check_permission_and_data(Collaborator, data, user_role)
+        async with request.state.db.begin() as session:
+            result, status_code = await CollabAPI.apply_update(
+                session, request.state.jwt_payload, request.path_params["id"], data
+            )
+        return JSONResponse(result, status_code=status_code)
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Collaborator)
+    async def update_collaborators(request: Request) -> JSONResponse:
+        return await batch_update(request, CollabAPI.apply_update)
+
+    @staticmethod
+    async def apply_update(session: AsyncSession, user: dict, collab_id: int, data: dict) -> tuple[dict, int]:
+        cleaned_data = check_permission_and_data(Collaborator, data, user.get("role"))
         if cleaned_data:
 
             if cleaned_data.get("error"):
-                return JSONResponse(cleaned_data, status_code=400)
+                return cleaned_data, 400
 
-            stmt = select(Collaborator).where(Collaborator.id == request.path_params["id"])
-            with request.state.db.begin() as session:
-                collab = session.scalar(stmt)
-                if collab:
-                    for field, value in cleaned_data.items():
-                        setattr(collab, field, value)
-                    return JSONResponse({"status": "Collaborator updated"})
-                else:
-                    capture_message("Outside the CLI application", "warning")
-                    return JSONResponse({"error": "Invalid collaborator id"}, status_code=400)
+            collab = await session.scalar(select(Collaborator).where(Collaborator.id == collab_id))
+            if collab:
+                for field, value in cleaned_data.items():
+                    setattr(collab, field, value)
+                await session.flush()
+                collab = await session.scalar(CollabAPI.select_one(collab.id))
+                return {"status": "Collaborator updated", "collaborator": CollabAPI.serialize(collab)}, 200
+            else:
+                capture_message("Outside the CLI application", "warning")
+                return {"error": "Invalid collaborator id"}, 400
         else:
-            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+            return {"error": "Unauthorized"}, 401
 
     @staticmethod
     @handle_db_errors
+    @invalidate_cache(Collaborator, Client, Contract, Event)
     async def delete_collaborator(request: Request) -> JSONResponse:
         user_role = request.state.jwt_payload.get("role")
         if user_role == "gestion":
-            stmt = select(Collaborator).where(Collaborator.id == request.path_params["id"])
-            with request.state.db.begin() as session:
-                collab = session.scalar(stmt)
-                if collab:
-                    session.delete(collab)
+            collab_id = request.path_params["id"]
+            async with request.state.db.begin() as session:
+                if await session.scalar(select(CollabAPI.has_portfolio(collab_id))):
+                    return JSONResponse(
+                        {"error": "Reassign the clients, contracts and events of this collaborator first"},
+                        status_code=400
+                    )
+                result = await session.execute(delete(Collaborator).where(Collaborator.id == collab_id))
+                if result.rowcount:
                     return JSONResponse({"status": "Collaborator deleted"})
                 else:
                     capture_message("Outside the CLI application", "warning")
                     return JSONResponse({"error": "Invalid collaborator id"}, status_code=400)
         else:
             return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    @staticmethod
+    def has_portfolio(collab_id: int):
+        return or_(
+            exists().where(Client.commercial_id == collab_id),
+            exists().where(Contract.commercial_id == collab_id),
+            exists().where(Event.support_id == collab_id)
+        )
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Client, Contract, Event)
+    async def reassign_portfolio(request: Request) -> JSONResponse:
+        # {"from_id": 2, "to_id": 5}: clients, contracts and events of a collaborator moved to another
+        if request.state.jwt_payload.get("role") != "gestion":
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+        data = await request.json()
+        from_id, to_id = data.get("from_id"), data.get("to_id")
+        # bool is an int subclass, true would be read as the collaborator 1
+        if not is_positive_int(from_id) or not is_positive_int(to_id) or from_id == to_id:
+            return JSONResponse({"error": "Expected two different collaborator ids"}, status_code=400)
+
+        async with request.state.db.begin() as session:
+            stmt = select(Collaborator.id, Role.role).join(Role).where(Collaborator.id.in_([from_id, to_id]))
+            roles = dict((await session.execute(stmt)).all())
+            if len(roles) != 2:
+                return JSONResponse({"error": "Invalid collaborator id"}, status_code=400)
+            if roles[from_id] != roles[to_id]:
+                return JSONResponse({"error": "Collaborators must have the same role"}, status_code=400)
+
+            # balance rows locked before the moves and in key order like update_balances():
+            # a concurrent contract write waits and then applies to the right commercial
+            stmt = (
+                select(CommercialBalance)
+                .where(CommercialBalance.commercial_id.in_([from_id, to_id]))
+                .order_by(CommercialBalance.commercial_id)
+                .with_for_update()
+            )
+            balances = {balance.commercial_id: balance for balance in await session.scalars(stmt)}
+
+            # one UPDATE per table whatever the size of the portfolio
+            moved = {}
+            for name, column in [
+                ("clients", Client.commercial_id),
+                ("contracts", Contract.commercial_id),
+                ("events", Event.support_id)
+            ]:
+                result = await session.execute(
+                    update(column.class_)
+                    .where(column == from_id)
+                    .values({column.key: to_id})
+                    .execution_options(synchronize_session=False)
+                )
+                moved[name] = result.rowcount
+
+            # the balance of the contracts follows, the client balances do not change
+            if balance := balances.get(from_id):
+                totals = {"client_id": None, **{column: getattr(balance, column) for column in BALANCE_COLUMNS}}
+                await update_balances(
+                    session,
+                    added=[{**totals, "commercial_id": to_id}],
+                    removed=[{**totals, "commercial_id": from_id}]
+                )
+        return JSONResponse({"status": "Portfolio reassigned", **moved})
@@ -0,0 +1,36 @@
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from server.api_work import ClientAPI, ContractAPI, EventAPI
+from server.permissions import handle_db_errors
+from server.projection import requested_fields
+from server.streaming import csv_response
+
+
+class ExportAPI:
+    # resource -> list API with filtered() and projection
+    resources = {
+        "client": ClientAPI,
+        "contract": ContractAPI,
+        "event": EventAPI
+    }
+
+    @classmethod
+    def get_routes(cls) -> list[Route]:
+        return [
+            Route('/export/{resource}', cls.export, methods=["GET"])
+        ]
+
+    @staticmethod
+    @handle_db_errors
+    async def export(request: Request) -> Response:
+        api = ExportAPI.resources.get(request.path_params["resource"])
+        if api is None:
+            return JSONResponse({"error": "Unknown resource"}, status_code=404)
+        # same filters and display columns as the list route, formatted in SQL
+        fields = requested_fields(request, api.projection) or list(api.projection)
+        stmt = api.filtered(request.query_params)
+        stmt = stmt.with_only_columns(*[api.projection[field].label(field) for field in fields])
+        stmt = stmt.order_by(api.projection["id"])
+        return csv_response(request, stmt, f"{request.path_params['resource']}s.csv")
@@ -0,0 +1,29 @@
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.requests import Request
+
+from server.middlewares import token_cache
+from server.cache import response_cache
+from server.permissions import handle_db_errors
+
+
+class MetricsAPI:
+
+    @classmethod
+    def get_routes(cls) -> list[Route]:
+        return [
+            Route('/metrics', cls.get_metrics, methods=["GET"])
+        ]
+
+    @staticmethod
+    @handle_db_errors
+    async def get_metrics(request: Request) -> JSONResponse:
+        if request.state.jwt_payload.get("role") == "gestion":
+            return JSONResponse(
+                {
+                    "jwt_cache": token_cache.stats(),
+                    "response_cache": response_cache.stats()
+                }
+            )
+        else:
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
@@ -0,0 +1,144 @@
+import datetime
+
+from sqlalchemy import Select, select, func, false, true
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.requests import Request
+
+from server.models import Collaborator, Role, Client, Contract, Event, CommercialBalance, ClientBalance
+from server.rollups import BALANCE_COLUMNS
+from server.permissions import handle_db_errors
+from server.cache import cached_response
+
+COUNTERS = ["outstanding", "debtor_contracts", "unsigned_contracts", "events_without_support", "upcoming_events"]
+
+
+class StatsAPI:
+    # scope -> balance kept up to date by the contract routes
+    balances = {
+        "commercial": CommercialBalance,
+        "client": ClientBalance
+    }
+
+    @classmethod
+    def get_routes(cls) -> list[Route]:
+        return [
+            Route('/stats', cls.get_stats, methods=["GET"]),
+            Route('/balance/{scope}/{id:int}', cls.get_balance, methods=["GET"])
+        ]
+
+    @staticmethod
+    def statement(upcoming_from: datetime.datetime) -> Select:
+        # one row per commercial and support with the totals of the whole tables,
+        # every number is aggregated by the database in one statement
+        contracts = (
+            select(
+                Contract.commercial_id,
+                func.sum(Contract.remaining_to_pay).label("outstanding"),
+                func.count().filter(Contract.remaining_to_pay > 0).label("debtor_contracts"),
+                func.count().filter(Contract.status == false()).label("unsigned_contracts")
+            )
+            .group_by(Contract.commercial_id)
+            .subquery()
+        )
+        no_support = (
+            select(Contract.commercial_id, func.count().label("events_without_support"))
+            .join(Event, Event.contract_id == Contract.id)
+            .where(Event.support_id.is_(None))
+            .group_by(Contract.commercial_id)
+            .subquery()
+        )
+        upcoming = (
+            select(Event.support_id, func.count().label("upcoming_events"))
+            .where(Event.event_start > upcoming_from)
+            .group_by(Event.support_id)
+            .subquery()
+        )
+        collaborators = (
+            select(
+                Collaborator.id,
+                Collaborator.name,
+                Role.role,
+                func.coalesce(contracts.c.outstanding, 0).label("outstanding"),
+                func.coalesce(contracts.c.debtor_contracts, 0).label("debtor_contracts"),
+                func.coalesce(contracts.c.unsigned_contracts, 0).label("unsigned_contracts"),
+                func.coalesce(no_support.c.events_without_support, 0).label("events_without_support"),
+                func.coalesce(upcoming.c.upcoming_events, 0).label("upcoming_events")
+            )
+            .join(Role, Role.id == Collaborator.role_id)
+            .outerjoin(contracts, contracts.c.commercial_id == Collaborator.id)
+            .outerjoin(no_support, no_support.c.commercial_id == Collaborator.id)
+            .outerjoin(upcoming, upcoming.c.support_id == Collaborator.id)
+            .where(Role.role.in_(["commercial", "support"]))
+            .subquery()
+        )
+        # totals over all the contracts and events, the unassigned ones included
+        contract_totals = select(
+            func.coalesce(func.sum(Contract.remaining_to_pay), 0).label("total_outstanding"),
+            func.count().filter(Contract.remaining_to_pay > 0).label("total_debtor_contracts"),
+            func.count().filter(Contract.status == false()).label("total_unsigned_contracts")
+        ).subquery()
+        event_totals = select(
+            func.count().filter(Event.support_id.is_(None)).label("total_events_without_support"),
+            func.count().filter(Event.event_start > upcoming_from).label("total_upcoming_events")
+        ).subquery()
+        # the totals row is kept when there is no collaborator
+        return (
+            select(contract_totals, event_totals, collaborators)
+            .select_from(
+                contract_totals
+                .join(event_totals, true())
+                .outerjoin(collaborators, true())
+            )
+            .order_by(collaborators.c.id)
+        )
+
+    @staticmethod
+    @handle_db_errors
+    async def get_stats(request: Request) -> JSONResponse:
+        # the role is checked before the cache, the cached body is only for gestion
+        if request.state.jwt_payload.get("role") != "gestion":
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+        # bound of the upcoming events, truncated to the minute: part of the cache key
+        request.state.upcoming_from = datetime.datetime.now().replace(second=0, microsecond=0)
+        return await StatsAPI.stats_response(request)
+
+    @staticmethod
+    @cached_response(Collaborator, Contract, Event, vary=lambda request: request.state.upcoming_from)
+    async def stats_response(request: Request) -> JSONResponse:
+        async with request.state.db.begin() as session:
+            rows = (await session.execute(StatsAPI.statement(request.state.upcoming_from))).mappings().all()
+        commercials = [
+            {key: row[key] for key in ["id", "name", "outstanding", "debtor_contracts",
+                                       "unsigned_contracts", "events_without_support"]}
+            for row in rows if row["role"] == "commercial"
+        ]
+        supports = [
+            {key: row[key] for key in ["id", "name", "upcoming_events"]}
+            for row in rows if row["role"] == "support"
+        ]
+        totals = {counter: rows[0][f"total_{counter}"] for counter in COUNTERS}
+        return JSONResponse({"commercials": commercials, "supports": supports, "totals": totals})
+
+    @staticmethod
+    @handle_db_errors
+    async def get_balance(request: Request) -> JSONResponse:
+        model = StatsAPI.balances.get(request.path_params["scope"])
+        if model is None:
+            return JSONResponse({"error": "Unknown balance"}, status_code=404)
+        user = request.state.jwt_payload
+        balance_id = request.path_params["id"]
+        async with request.state.db.begin() as session:
+            if user.get("role") == "commercial":
+                # a commercial reads their own balance and the balances of their clients
+                owner_id = balance_id if model is CommercialBalance else await session.scalar(
+                    select(Client.commercial_id).where(Client.id == balance_id)
+                )
+                if owner_id != user.get("id"):
+                    return JSONResponse({"error": "Unauthorized"}, status_code=401)
+            elif user.get("role") != "gestion":
+                return JSONResponse({"error": "Unauthorized"}, status_code=401)
+            # one primary key lookup, no contract is read
+            balance = await session.get(model, balance_id)
+        values = {column: getattr(balance, column) if balance else 0 for column in BALANCE_COLUMNS}
+        return JSONResponse({"balance": {"id": balance_id, **values}})
@@ -1,51 +1,152 @@
-from sqlalchemy import select, false, true, update
+from sqlalchemy import Select, select, true, update, func, cast, String, or_, literal, literal_column
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 from starlette.routing import Route
 from starlette.requests import Request
 
 from sentry_sdk import capture_message
 from server.models import Collaborator, Client, Contract, Event
-from server.permissions import handle_db_errors, check_permission_and_data
+from server.pagination import paginate, split_page, query_int, MAX_LIMIT
+from server.streaming import wants_stream, ndjson_response
+from server.projection import requested_fields, projection_response
+from server.permissions import handle_db_errors, check_permission_and_data, to_db_values
+from server.cache import cached_response, invalidate_cache
+from server.batch import batch_update
+from server.bulk_import import bulk_import
+from server.rollups import contract_values, contract_totals, update_balances
+
+# trigram indexes need at least 3 characters to narrow the search
+MIN_SEARCH_LENGTH = 3
+SEARCH_LIMIT = 20
 
 
 class ClientAPI:
+    # columns for ?fields= projection, formatted in SQL like serialize()
+    projection = {
+        "id": Client.id,
+        "name": Client.name,
+        "email": Client.email,
+        "phone": Client.phone,
+        "company": Client.company,
+        "create_date": func.to_char(Client.create_date, "DD-MM-YYYY HH24:MI:SS"),
+        "update_date": func.coalesce(func.to_char(Client.update_date, "DD-MM-YYYY HH24:MI:SS"), "never updated"),
+        "commercial": func.coalesce(
+            select(Collaborator.name)
+            .where(Collaborator.id == Client.commercial_id)
+            .correlate(Client)
+            .scalar_subquery(),
+            "None"
+        )
+    }
+
     @classmethod
     def get_routes(cls):
         return [
             Route('/client', cls.get_clients, methods=["GET"]),
+            Route('/client/{id:int}', cls.get_client, methods=["GET"]),
+            Route('/client/search', cls.search_clients, methods=["GET"]),
             Route('/client/create', cls.create_client, methods=["POST"]),
-            Route('/client/update/{id}', cls.update_client, methods=["POST"])
+            Route('/client/import', cls.import_clients, methods=["POST"]),
+            Route('/client/update', cls.update_clients, methods=["POST"]),
+            Route('/client/update/{id:int}', cls.update_client, methods=["POST"])
         ]
 
     @staticmethod
     @handle_db_errors
+    @cached_response(Client, Collaborator)
     async def get_clients(request: Request) -> JSONResponse:
+        stmt = ClientAPI.filtered(request.query_params)
+        stmt, limit = paginate(stmt, Client.id, request.query_params)
+        if fields := requested_fields(request, ClientAPI.projection):
+            return await projection_response(request, stmt, ClientAPI.projection, fields, "clients", limit)
+
+        stmt = stmt.options(joinedload(Client.commercial))
+        if wants_stream(request):
+            return ndjson_response(request, stmt.limit(limit), ClientAPI.serialize)
+        async with request.state.db.begin() as session:
+            data, next_cursor = split_page((await session.scalars(stmt)).all(), limit)
+            clients = [ClientAPI.serialize(client) for client in data]
+        return JSONResponse({"clients": clients, "next_cursor": next_cursor})
+
+    @staticmethod
+    def filtered(params) -> Select:
+        # list filters, shared with the export
         stmt = select(Client)
-        if commercial_id := request.query_params.get("commercial_id"):
+        if commercial_id := query_int(params, "commercial_id"):
             stmt = stmt.join(Collaborator).filter(Collaborator.id == commercial_id)
-        elif "unassigned" in request.query_params:
+        elif "unassigned" in params:
             stmt = stmt.filter(Client.commercial_id.is_(None))
-        with request.state.db.begin() as session:
-            data = session.scalars(stmt).all()
-            clients = [
-                {
-                    "id": client.id,
-                    "name": client.name,
-                    "email": client.email,
-                    "phone": client.phone,
-                    "company": client.company,
-                    "create_date": client.create_date.strftime("%d-%m-%Y %H:%M:%S"),
-                    "update_date": client.update_date.strftime(
-                        "%d-%m-%Y %H:%M:%S"
-                    ) if client.update_date else "never updated",
-                    "commercial": client.commercial.__str__()
-                }
-                for client in data
-            ]
+        return stmt
+
+    @staticmethod
+    @handle_db_errors
+    @cached_response(Client, Collaborator)
+    async def get_client(request: Request) -> JSONResponse:
+        async with request.state.db.begin() as session:
+            client = await session.scalar(ClientAPI.select_one(request.path_params["id"]))
+            if client:
+                return JSONResponse({"client": ClientAPI.serialize(client)})
+        return JSONResponse({"error": "Invalid client id"}, status_code=404)
+
+    @staticmethod
+    @handle_db_errors
+    @cached_response(Client, Collaborator)
+    async def search_clients(request: Request) -> JSONResponse:
+        query = request.query_params.get("q", "").strip()
+        if len(query) < MIN_SEARCH_LENGTH:
+            return JSONResponse(
+                {"error": f"Search needs at least {MIN_SEARCH_LENGTH} characters"},
+                status_code=400
+            )
+        limit = min(query_int(request.query_params, "limit", SEARCH_LIMIT, minimum=1), MAX_LIMIT)
+
+        # ILIKE and word similarity (<%) are both served by the trigram indexes
+        columns = [Client.name, Client.company, Client.email]
+        pattern = "%" + query.replace("/", "//").replace("%", "/%").replace("_", "/_") + "%"
+        contains = or_(*[column.ilike(pattern, escape="/") for column in columns])
+        similar = or_(*[literal(query).op("<%")(column) for column in columns])
+        rank = func.greatest(*[func.word_similarity(query, column) for column in columns])
+        stmt = (
+            select(Client)
+            .where(or_(contains, similar))
+            .options(joinedload(Client.commercial))
+            # substring matches first, then the closest fuzzy matches
+            .order_by(contains.desc(), rank.desc(), Client.id)
+            .limit(limit)
+        )
+        async with request.state.db.begin() as session:
+            clients = [ClientAPI.serialize(client) for client in (await session.scalars(stmt)).all()]
         return JSONResponse({"clients": clients})
 
+    @staticmethod
+    def select_one(client_id: int) -> Select:
+        # populate_existing: also reloads a client just updated in the session
+        return (
+            select(Client)
+            .where(Client.id == client_id)
+            .options(joinedload(Client.commercial))
+            .execution_options(populate_existing=True)
+        )
+
+    @staticmethod
+    def serialize(client: Client) -> dict:
+        return {
+            "id": client.id,
+            "name": client.name,
+            "email": client.email,
+            "phone": client.phone,
+            "company": client.company,
+            "create_date": client.create_date.strftime("%d-%m-%Y %H:%M:%S"),
+            "update_date": client.update_date.strftime(
+                "%d-%m-%Y %H:%M:%S"
+            ) if client.update_date else "never updated",
+            "commercial": client.commercial.__str__()
+        }
+
     @staticmethod
     @handle_db_errors
+    @invalidate_cache(Client)
     async def create_client(request: Request) -> JSONResponse:
         role = request.state.jwt_payload.get("role")
         user_id = request.state.jwt_payload.get("id")
@@ -59,7 +160,7 @@ class ClientAPI:
 
                 cleaned_data["commercial_id"] = user_id
                 new_client = Client(**cleaned_data)
-                with request.state.db.begin() as session:
+                async with request.state.db.begin() as session:
                     session.add(new_client)
                     return JSONResponse({"status": "Client created"})
 
@@ -67,87 +168,180 @@ class ClientAPI:
 
     @staticmethod
     @handle_db_errors
-    async def update_client(request: Request):
-        role = request.state.jwt_payload.get("role")
-        user_id = request.state.jwt_payload.get("id")
+    @invalidate_cache(Client)
+    async def import_clients(request: Request) -> JSONResponse:
+        if request.state.jwt_payload.get("role") == "commercial":
+            return await bulk_import(request, Client, ("name", "email", "phone", "company"), ClientAPI.prepare_import)
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    @staticmethod
+    async def prepare_import(session: AsyncSession, user: dict, rows: list[tuple[int, dict]]) -> tuple[list, list]:
+        for _, row in rows:
+            row["commercial_id"] = user.get("id")
+        return rows, []
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Client, Contract)
+    async def update_client(request: Request) -> JSONResponse:
         data = await request.json()
+        async with request.state.db.begin() as session:
+            result, status_code = await ClientAPI.apply_update(
+                session, request.state.jwt_payload, request.path_params["id"], data
+            )
+        return JSONResponse(result, status_code=status_code)
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Client, Contract)
+    async def update_clients(request: Request) -> JSONResponse:
+        return await batch_update(request, ClientAPI.apply_update)
+
+    @staticmethod
+    async def apply_update(session: AsyncSession, user: dict, client_id: int, data: dict) -> tuple[dict, int]:
+        role = user.get("role")
         cleaned_data = check_permission_and_data(Client, data, role)
         if cleaned_data:
 
             if cleaned_data.get("error"):
-                return JSONResponse(cleaned_data, status_code=400)
-
-            stmt = select(Client).where(Client.id == request.path_params["id"])
-            with request.state.db.begin() as session:
-                client = session.scalar(stmt)
-                commercial_condition = all([role == "commercial", client.commercial_id == user_id])
-                gestion_condition = all([role == "gestion" and client.commercial_id is None])
-                if commercial_condition or gestion_condition:
-                    for field, value in cleaned_data.items():
-                        setattr(client, field, value)
-                        if field == "commercial_id":
-                            session.execute(
-                                update(Contract)
-                                .where(Contract.client_id == client.id)
-                                .values(commercial_id=value)
-                            )
-                    return JSONResponse({"status": "Client updated"})
-                else:
-                    capture_message("Outside the CLI application", "warning")
-                    return JSONResponse(
-                        {"error": "Not your client" if commercial_condition else "Commercial already assigned"},
-                        status_code=400
-                    )
+                return cleaned_data, 400
+
+            client = await session.scalar(select(Client).where(Client.id == client_id))
+            if client is None:
+                capture_message("Outside the CLI application", "warning")
+                return {"error": "Invalid client id"}, 400
+            commercial_condition = all([role == "commercial", client.commercial_id == user.get("id")])
+            gestion_condition = all([role == "gestion" and client.commercial_id is None])
+            if commercial_condition or gestion_condition:
+                for field, value in cleaned_data.items():
+                    setattr(client, field, value)
+                    if field == "commercial_id":
+                        # the contracts move to the balance of the new commercial
+                        totals = (await session.execute(contract_totals(client.id))).mappings().all()
+                        await session.execute(
+                            update(Contract)
+                            .where(Contract.client_id == client.id)
+                            .values(commercial_id=value)
+                        )
+                        await update_balances(
+                            session,
+                            added=[{**row, "commercial_id": value} for row in totals],
+                            removed=totals
+                        )
+                await session.flush()
+                client = await session.scalar(ClientAPI.select_one(client.id))
+                return {"status": "Client updated", "client": ClientAPI.serialize(client)}, 200
+            else:
+                capture_message("Outside the CLI application", "warning")
+                return {"error": "Not your client" if commercial_condition else "Commercial already assigned"}, 400
         else:
-            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+            return {"error": "Unauthorized"}, 401
 
 
 class ContractAPI:
+    # columns for ?fields= projection, formatted in SQL like serialize()
+    projection = {
+        "id": Contract.id,
+        "client": select(Client.name).where(Client.id == Contract.client_id).correlate(Contract).scalar_subquery(),
+        "commercial": func.coalesce(
+            select(Collaborator.name)
+            .join(Client, Client.commercial_id == Collaborator.id)
+            .where(Client.id == Contract.client_id)
+            .correlate(Contract)
+            .scalar_subquery(),
+            "None"
+        ),
+        "event_title": Contract.event_title,
+        "total_cost": Contract.total_cost,
+        "remaining_to_pay": Contract.remaining_to_pay,
+        "date": func.to_char(Contract.date, "DD/MM/YYYY"),
+        "status": Contract.status
+    }
+
     @classmethod
     def get_routes(cls) -> list[Route]:
         return [
             Route('/contract', cls.get_contracts, methods=["GET"]),
+            Route('/contract/{id:int}', cls.get_contract, methods=["GET"]),
             Route('/contract/create', cls.create_contract, methods=["POST"]),
-            Route('/contract/update/{id}', cls.update_contract, methods=["POST"])
+            Route('/contract/import', cls.import_contracts, methods=["POST"]),
+            Route('/contract/update', cls.update_contracts, methods=["POST"]),
+            Route('/contract/update/{id:int}', cls.update_contract, methods=["POST"])
         ]
 
     @staticmethod
     @handle_db_errors
+    @cached_response(Contract, Client, Collaborator)
     async def get_contracts(request: Request) -> JSONResponse:
+        stmt = ContractAPI.filtered(request.query_params)
+        stmt, limit = paginate(stmt, Contract.id, request.query_params)
+        if fields := requested_fields(request, ContractAPI.projection):
+            return await projection_response(request, stmt, ContractAPI.projection, fields, "contracts", limit)
+
+        stmt = stmt.options(joinedload(Contract.client).joinedload(Client.commercial))
+        if wants_stream(request):
+            return ndjson_response(request, stmt.limit(limit), ContractAPI.serialize)
+        async with request.state.db.begin() as session:
+            data, next_cursor = split_page((await session.scalars(stmt)).all(), limit)
+            contracts = [ContractAPI.serialize(contract) for contract in data]
+        return JSONResponse({"contracts": contracts, "next_cursor": next_cursor})
+
+    @staticmethod
+    def filtered(params) -> Select:
+        # list filters, shared with the export
         stmt = select(Contract)
-        if request.query_params.get("commercial_id"):
+        if params.get("commercial_id"):
             stmt = stmt.join(Collaborator)
-        for key, value in request.query_params.items():
+        for key, value in params.items():
             match key:
                 case "commercial_id":
                     stmt = stmt.filter(
-                        Collaborator.id == int(value),
+                        Collaborator.id == query_int(params, "commercial_id"),
                         Contract.status == true()
                     )
+                # literals, not bound parameters: the planner matches them with the partial indexes
                 case "no_signed":
-                    stmt = stmt.filter(Contract.status == false())
+                    stmt = stmt.filter(Contract.status == literal_column("false"))
                 case "debtor":
-                    stmt = stmt.filter(Contract.remaining_to_pay > 0)
-
-        with request.state.db.begin() as session:
-            data = session.scalars(stmt).all()
-            contracts = [
-                {
-                    "id": contract.id,
-                    "client": contract.client.__str__(),
-                    "commercial": contract.client.commercial.__str__(),
-                    "event_title": contract.event_title,
-                    "total_cost": contract.total_cost,
-                    "remaining_to_pay": contract.remaining_to_pay,
-                    "date": contract.date.strftime("%d/%m/%Y"),
-                    "status": contract.status
-                }
-                for contract in data
-            ]
-        return JSONResponse({"contracts": contracts})
+                    stmt = stmt.filter(Contract.remaining_to_pay > literal_column("0"))
+        return stmt
 
     @staticmethod
     @handle_db_errors
+    @cached_response(Contract, Client, Collaborator)
+    async def get_contract(request: Request) -> JSONResponse:
+        async with request.state.db.begin() as session:
+            contract = await session.scalar(ContractAPI.select_one(request.path_params["id"]))
+            if contract:
+                return JSONResponse({"contract": ContractAPI.serialize(contract)})
+        return JSONResponse({"error": "Invalid contract id"}, status_code=404)
+
+    @staticmethod
+    def select_one(contract_id: int) -> Select:
+        # populate_existing: also reloads a contract just updated in the session
+        return (
+            select(Contract)
+            .where(Contract.id == contract_id)
+            .options(joinedload(Contract.client).joinedload(Client.commercial))
+            .execution_options(populate_existing=True)
+        )
+
+    @staticmethod
+    def serialize(contract: Contract) -> dict:
+        return {
+            "id": contract.id,
+            "client": contract.client.__str__(),
+            "commercial": contract.client.commercial.__str__(),
+            "event_title": contract.event_title,
+            "total_cost": contract.total_cost,
+            "remaining_to_pay": contract.remaining_to_pay,
+            "date": contract.date.strftime("%d/%m/%Y"),
+            "status": contract.status
+        }
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Contract)
     async def create_contract(request: Request) -> JSONResponse:
         user_role = request.state.jwt_payload.get("role")
         if user_role == "gestion":
@@ -157,13 +351,15 @@ class ContractAPI:
             if cleaned_data.get("error"):
                 return JSONResponse(cleaned_data, status_code=400)
 
+            cleaned_data = to_db_values(cleaned_data)
             stmt = select(Client).where(Client.id == cleaned_data.get("client_id"))
-            with request.state.db.begin() as session:
-                client = session.scalar(stmt)
+            async with request.state.db.begin() as session:
+                client = await session.scalar(stmt)
                 if client:
                     cleaned_data["commercial_id"] = client.commercial_id
                     new_contract = Contract(**cleaned_data)
                     session.add(new_contract)
+                    await update_balances(session, added=[cleaned_data])
                     return JSONResponse({"status": "contract created"})
                 else:
                     capture_message("Outside the CLI application", "warning")
@@ -173,70 +369,183 @@ class ContractAPI:
 
     @staticmethod
     @handle_db_errors
+    @invalidate_cache(Contract)
+    async def import_contracts(request: Request) -> JSONResponse:
+        if request.state.jwt_payload.get("role") == "gestion":
+            required = ("client_id", "event_title", "total_cost", "remaining_to_pay", "date", "status")
+            return await bulk_import(
+                request, Contract, required, ContractAPI.prepare_import, on_insert=ContractAPI.after_import
+            )
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    @staticmethod
+    async def prepare_import(session: AsyncSession, user: dict, rows: list[tuple[int, dict]]) -> tuple[list, list]:
+        # the commercial of each contract is the commercial of its client, one query per batch
+        client_ids = {row["client_id"] for _, row in rows}
+        stmt = select(Client.id, Client.commercial_id).where(Client.id.in_(client_ids))
+        commercials = {client_id: commercial_id for client_id, commercial_id in await session.execute(stmt)}
+        valid, errors = [], []
+        for line_number, row in rows:
+            if row["client_id"] in commercials:
+                row["commercial_id"] = commercials[row["client_id"]]
+                valid.append((line_number, row))
+            else:
+                errors.append((line_number, "Invalid client"))
+        return valid, errors
+
+    @staticmethod
+    async def after_import(session: AsyncSession, rows: list[dict]) -> None:
+        await update_balances(session, added=rows)
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Contract)
     async def update_contract(request: Request) -> JSONResponse:
-        user = request.state.jwt_payload
         data = await request.json()
+        async with request.state.db.begin() as session:
+            result, status_code = await ContractAPI.apply_update(
+                session, request.state.jwt_payload, request.path_params["id"], data
+            )
+        return JSONResponse(result, status_code=status_code)
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Contract)
+    async def update_contracts(request: Request) -> JSONResponse:
+        return await batch_update(request, ContractAPI.apply_update)
+
+    @staticmethod
+    async def apply_update(session: AsyncSession, user: dict, contract_id: int, data: dict) -> tuple[dict, int]:
         cleaned_data = check_permission_and_data(Contract, data, user.get("role"))
         if cleaned_data:
 
             if cleaned_data.get("error"):
-                return JSONResponse(cleaned_data, status_code=400)
-
-            stmt = select(Contract).where(Contract.id == request.path_params["id"])
-            with request.state.db.begin() as session:
-                contract = session.scalar(stmt)
-                if contract:
-                    if user.get("role") == "commercial" and contract.commercial_id != user.get("id"):
-                        return JSONResponse({"error": "Not your client"}, status_code=400)
-                    for field, value in cleaned_data.items():
-                        setattr(contract, field, value)
-                    return JSONResponse({"status": "Contract updated"})
-                else:
-                    capture_message("Outside the CLI application", "warning")
-                    return JSONResponse({"error": "Invalid contract"}, status_code=400)
+                return cleaned_data, 400
+
+            cleaned_data = to_db_values(cleaned_data)
+            contract = await session.scalar(select(Contract).where(Contract.id == contract_id))
+            if contract:
+                if user.get("role") == "commercial" and contract.commercial_id != user.get("id"):
+                    return {"error": "Not your client"}, 400
+                previous = contract_values(contract)
+                for field, value in cleaned_data.items():
+                    setattr(contract, field, value)
+                await update_balances(session, added=[contract_values(contract)], removed=[previous])
+                await session.flush()
+                contract = await session.scalar(ContractAPI.select_one(contract.id))
+                return {"status": "Contract updated", "contract": ContractAPI.serialize(contract)}, 200
+            else:
+                capture_message("Outside the CLI application", "warning")
+                return {"error": "Invalid contract"}, 400
         else:
-            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+            return {"error": "Unauthorized"}, 401
 
 
 class EventAPI:
+    # columns for ?fields= projection, formatted in SQL like serialize()
+    projection = {
+        "id": Event.id,
+        "contract": cast(Event.contract_id, String),
+        "client": select(Client.name).where(Client.id == Event.client_id).correlate(Event).scalar_subquery(),
+        "title": select(Contract.event_title).where(Contract.id == Event.contract_id).correlate(Event).scalar_subquery(),
+        "event_start": func.to_char(Event.event_start, "DD/MM/YYYY HH24:MI"),
+        "event_end": func.to_char(Event.event_end, "DD/MM/YYYY HH24:MI"),
+        "support": func.coalesce(
+            select(Collaborator.name)
+            .where(Collaborator.id == Event.support_id)
+            .correlate(Event)
+            .scalar_subquery(),
+            "None"
+        ),
+        "location": Event.location,
+        "attendees": Event.attendees,
+        "note": Event.note
+    }
+
     @classmethod
     def get_routes(cls) -> list[Route]:
         return [
             Route('/event', cls.get_events, methods=["GET"]),
+            Route('/event/{id:int}', cls.get_event, methods=["GET"]),
             Route('/event/create', cls.create_event, methods=["POST"]),
-            Route('/event/update/{id}', cls.update_event, methods=["POST"])
+            Route('/event/import', cls.import_events, methods=["POST"]),
+            Route('/event/update', cls.update_events, methods=["POST"]),
+            Route('/event/update/{id:int}', cls.update_event, methods=["POST"])
         ]
 
     @staticmethod
     @handle_db_errors
+    @cached_response(Event, Contract, Client, Collaborator)
     async def get_events(request: Request) -> JSONResponse:
+        stmt = EventAPI.filtered(request.query_params)
+        stmt, limit = paginate(stmt, Event.id, request.query_params)
+        if fields := requested_fields(request, EventAPI.projection):
+            return await projection_response(request, stmt, EventAPI.projection, fields, "events", limit)
+
+        stmt = stmt.options(
+            joinedload(Event.client),
+            joinedload(Event.contract),
+            joinedload(Event.support)
+        )
+        if wants_stream(request):
+            return ndjson_response(request, stmt.limit(limit), EventAPI.serialize)
+        async with request.state.db.begin() as session:
+            data, next_cursor = split_page((await session.scalars(stmt)).all(), limit)
+            events = [EventAPI.serialize(event) for event in data]
+        return JSONResponse({"events": events, "next_cursor": next_cursor})
+
+    @staticmethod
+    def filtered(params) -> Select:
+        # list filters, shared with the export
         stmt = select(Event)
-        if support_id := request.query_params.get("support_id"):
+        if support_id := query_int(params, "support_id"):
             stmt = stmt.join(Collaborator).filter(Collaborator.id == support_id)
-        elif "no_support" in request.query_params.keys():
+        elif "no_support" in params.keys():
             stmt = stmt.filter(Event.support_id.is_(None))
+        return stmt
+
+    @staticmethod
+    @handle_db_errors
+    @cached_response(Event, Contract, Client, Collaborator)
+    async def get_event(request: Request) -> JSONResponse:
+        async with request.state.db.begin() as session:
+            event = await session.scalar(EventAPI.select_one(request.path_params["id"]))
+            if event:
+                return JSONResponse({"event": EventAPI.serialize(event)})
+        return JSONResponse({"error": "Invalid event id"}, status_code=404)
+
+    @staticmethod
+    def select_one(event_id: int) -> Select:
+        # populate_existing: also reloads an event just updated in the session
+        return (
+            select(Event)
+            .where(Event.id == event_id)
+            .options(
+                joinedload(Event.client),
+                joinedload(Event.contract),
+                joinedload(Event.support)
+            )
+            .execution_options(populate_existing=True)
+        )
 
-        with request.state.db.begin() as session:
-            data = session.scalars(stmt).all()
-            events = [
-                {
-                    "id": event.id,
-                    "contract": event.contract_id.__str__(),
-                    "client": event.client.__str__(),
-                    "title": event.contract.event_title,
-                    "event_start": event.event_start.strftime("%d/%m/%Y %H:%M"),
-                    "event_end": event.event_end.strftime("%d/%m/%Y %H:%M"),
-                    "support": event.support.__str__(),
-                    "location": event.location,
-                    "attendees": event.attendees,
-                    "note": event.note
-                }
-                for event in data
-            ]
-        return JSONResponse({"events": events})
+    @staticmethod
+    def serialize(event: Event) -> dict:
+        return {
+            "id": event.id,
+            "contract": event.contract_id.__str__(),
+            "client": event.client.__str__(),
+            "title": event.contract.event_title,
+            "event_start": event.event_start.strftime("%d/%m/%Y %H:%M"),
+            "event_end": event.event_end.strftime("%d/%m/%Y %H:%M"),
+            "support": event.support.__str__(),
+            "location": event.location,
+            "attendees": event.attendees,
+            "note": event.note
+        }
 
     @staticmethod
     @handle_db_errors
+    @invalidate_cache(Event)
     async def create_event(request: Request) -> JSONResponse:
         user = request.state.jwt_payload
 
@@ -247,12 +556,13 @@ class EventAPI:
             if cleaned_data.get("error"):
                 return JSONResponse(cleaned_data, status_code=400)
 
+            cleaned_data = to_db_values(cleaned_data)
             stmt = select(Contract).where(Contract.id == data.get("contract_id"))
-            with request.state.db.begin() as session:
-                contract = session.scalar(stmt)
+            async with request.state.db.begin() as session:
+                contract = await session.scalar(stmt)
                 if contract:
                     stmt = select(Event).where(Event.contract_id == contract.id)
-                    event = session.scalar(stmt)
+                    event = await session.scalar(stmt)
                     if event is None:
                         conditions = [
                             contract.commercial_id == user.get("id"),
@@ -276,29 +586,81 @@ class EventAPI:
 
     @staticmethod
     @handle_db_errors
+    @invalidate_cache(Event)
+    async def import_events(request: Request) -> JSONResponse:
+        if request.state.jwt_payload.get("role") == "commercial":
+            required = ("contract_id", "event_start", "event_end", "location", "attendees", "note")
+            return await bulk_import(request, Event, required, EventAPI.prepare_import)
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    @staticmethod
+    async def prepare_import(session: AsyncSession, user: dict, rows: list[tuple[int, dict]]) -> tuple[list, list]:
+        # same rules as create_event, the contracts of the batch are read in one query
+        contract_ids = {row["contract_id"] for _, row in rows}
+        stmt = (
+            select(Contract.id, Contract.client_id, Contract.commercial_id, Contract.status, Event.id.label("event_id"))
+            .outerjoin(Event, Event.contract_id == Contract.id)
+            .where(Contract.id.in_(contract_ids))
+        )
+        contracts = {contract.id: contract for contract in await session.execute(stmt)}
+        # one event per contract, also inside the same batch
+        with_event = {contract.id for contract in contracts.values() if contract.event_id is not None}
+        valid, errors = [], []
+        for line_number, row in rows:
+            contract = contracts.get(row["contract_id"])
+            if contract is None:
+                errors.append((line_number, "Invalid contract id"))
+            elif contract.id in with_event:
+                errors.append((line_number, "Event is already created for this contract"))
+            elif contract.commercial_id != user.get("id") or not contract.status:
+                errors.append((line_number, "Not your client or contract unsigned"))
+            else:
+                row["client_id"] = contract.client_id
+                with_event.add(contract.id)
+                valid.append((line_number, row))
+        return valid, errors
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Event)
     async def update_event(request: Request) -> JSONResponse:
-        user_role = request.state.jwt_payload.get("role")
-        user_id = request.state.jwt_payload.get("id")
+        data = await request.json()
+        async with request.state.db.begin() as session:
+            result, status_code = await EventAPI.apply_update(
+                session, request.state.jwt_payload, request.path_params["id"], data
+            )
+        return JSONResponse(result, status_code=status_code)
+
+    @staticmethod
+    @handle_db_errors
+    @invalidate_cache(Event)
+    async def update_events(request: Request) -> JSONResponse:
+        return await batch_update(request, EventAPI.apply_update)
 
+    @staticmethod
+    async def apply_update(session: AsyncSession, user: dict, event_id: int, data: dict) -> tuple[dict, int]:
+        user_role = user.get("role")
         if user_role in ["gestion", "support"]:
-            data = await request.json()
             cleaned_data = check_permission_and_data(Event, data, role=user_role)
+            if not cleaned_data:
+                return {"error": "Unauthorized"}, 401
 
             if cleaned_data.get("error"):
-                return JSONResponse(cleaned_data, status_code=400)
+                return cleaned_data, 400
 
-            stmt = select(Event).where(Event.id == request.path_params["id"])
-            with request.state.db.begin() as session:
-                event = session.scalar(stmt)
-                if event:
-                    if user_role == "support" and event.support_id != user_id:
-                        capture_message("Outside the CLI application", "warning")
-                        return JSONResponse({"error": "Not your event"}, status_code=400)
-                    for field, value in cleaned_data.items():
-                        setattr(event, field, value)
-                    return JSONResponse({"status": "Event updated"})
-                else:
+            cleaned_data = to_db_values(cleaned_data)
+            event = await session.scalar(select(Event).where(Event.id == event_id))
+            if event:
+                if user_role == "support" and event.support_id != user.get("id"):
                     capture_message("Outside the CLI application", "warning")
-                    return JSONResponse({"error": "Invalid event id"}, status_code=400)
+                    return {"error": "Not your event"}, 400
+                for field, value in cleaned_data.items():
+                    setattr(event, field, value)
+                await session.flush()
+                event = await session.scalar(EventAPI.select_one(event.id))
+                return {"status": "Event updated", "event": EventAPI.serialize(event)}, 200
+            else:
+                capture_message("Outside the CLI application", "warning")
+                return {"error": "Invalid event id"}, 400
         else:
-            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+            return {"error": "Unauthorized"}, 401
@@ -0,0 +1,40 @@
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+MAX_BATCH_SIZE = 500
+
+
+def valid_item(item) -> bool:
+    # {"id": 1, "changes": {"field": value, ...}}
+    return isinstance(item, dict) and isinstance(item.get("id"), int) and isinstance(item.get("changes"), dict)
+
+
+async def batch_update(request: Request, apply_update) -> JSONResponse:
+    # apply_update(session, user, id, changes) -> (result, status_code) is called for each item
+    items = await request.json()
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH_SIZE:
+        return JSONResponse({"error": f"Expected a list of 1 to {MAX_BATCH_SIZE} updates"}, status_code=400)
+
+    results = []
+    async with request.state.db.begin() as session:
+        for item in items:
+            if not valid_item(item):
+                results.append({"id": None, "status_code": 400, "error": "Invalid update"})
+                continue
+            # a savepoint per item: a failing row does not cancel the others
+            try:
+                async with session.begin_nested():
+                    result, status_code = await apply_update(
+                        session,
+                        request.state.jwt_payload,
+                        item["id"],
+                        item["changes"]
+                    )
+            except IntegrityError:
+                result, status_code = {"error": "Integrity error"}, 400
+            except (ValueError, DBAPIError):
+                # impossible date (31/02), value rejected by the database
+                result, status_code = {"error": "Invalid value"}, 400
+            results.append({"id": item["id"], "status_code": status_code, **result})
+    return JSONResponse({"results": results})
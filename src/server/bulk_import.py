@@ -0,0 +1,193 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator
+
+from sqlalchemy import Boolean, Float, Integer, insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from server.permissions import to_db_values
+from shared.schemas import validate_many
+
+IMPORT_BATCH_SIZE = 1000
+# errors listed in the response, error_count is always complete
+MAX_REPORTED_ERRORS = 1000
+
+
+async def read_lines(request: Request) -> AsyncIterator[str]:
+    # body chunks -> lines, the body is never loaded in memory at once
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.removesuffix("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.removesuffix("\r")
+
+
+async def read_records(request: Request, is_csv: bool) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    # (line number, row, parse error) from a CSV body with a header line or from a NDJSON body
+    header = None
+    parts = []
+    quotes = 0
+    line_number = 0
+    async for line in read_lines(request):
+        line_number += 1
+        if not is_csv:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_number, None, "Invalid JSON"
+                    continue
+                if isinstance(row, dict):
+                    yield line_number, row, None
+                else:
+                    yield line_number, None, "Expected a JSON object"
+            continue
+
+        parts.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            # new line inside a quoted value, the record continues on the next line
+            continue
+        record = "\n".join(parts)
+        parts = []
+        quotes = 0
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [value.strip() for value in values]
+        elif len(values) != len(header):
+            yield line_number, None, "Wrong number of values"
+        else:
+            yield line_number, dict(zip(header, values)), None
+    if parts:
+        yield line_number, None, "Unclosed quote"
+
+
+def csv_values(model, row: dict) -> dict:
+    # CSV values are strings, convert them to the types expected by the validator
+    columns = model.__table__.columns
+    values = {}
+    for field, value in row.items():
+        if field in columns:
+            column_type = columns[field].type
+            if isinstance(column_type, Boolean) and value.lower() in ["0", "1", "false", "true"]:
+                value = value.lower() in ["1", "true"]
+            elif isinstance(column_type, (Integer, Float)) and value.isdigit():
+                value = int(value)
+        values[field] = value
+    return values
+
+
+def clean_rows(model, records: list, role: str, required: tuple[str, ...]) -> tuple[list, list]:
+    # same validation as the create routes, the schema of the role is applied to the whole batch;
+    # records are (line number, row, parse error), errors are (line number, error)
+    rows = [row for _, row, error in records if error is None]
+    results = iter(validate_many(model.__tablename__, role, rows))
+    valid, errors = [], []
+    for line_number, row, error in records:
+        if error is None:
+            cleaned_data = next(results)
+            missing = [field for field in required if field not in row]
+            if missing:
+                error = f"Missing field: {missing[0]}"
+            elif not cleaned_data:
+                error = "Unauthorized"
+            elif cleaned_data.get("error"):
+                error = cleaned_data["error"]
+            else:
+                try:
+                    valid.append((line_number, to_db_values(cleaned_data)))
+                except ValueError:
+                    error = "Invalid value"
+        if error:
+            errors.append((line_number, error))
+    return valid, errors
+
+
+def insert_error(error: DBAPIError) -> str:
+    return "Integrity error" if isinstance(error, IntegrityError) else "Invalid value"
+
+
+async def insert_batch(session, model, rows: list[tuple[int, dict]], report) -> list[dict]:
+    # one multi-row INSERT, row by row only to find the rows rejected by the database
+    try:
+        async with session.begin_nested():
+            await session.execute(insert(model), [row for _, row in rows])
+        return [row for _, row in rows]
+    except DBAPIError:
+        inserted = []
+        for line_number, row in rows:
+            try:
+                async with session.begin_nested():
+                    await session.execute(insert(model), [row])
+                inserted.append(row)
+            except DBAPIError as error:
+                report(line_number, insert_error(error))
+        return inserted
+
+
+async def import_batch(session, model, records: list, user: dict, required, prepare,
+                       on_insert=None) -> tuple[int, list]:
+    # number of inserted rows and the errors of the batch in line order, each step finds its own errors
+    rejected = []
+    batch, clean_errors = clean_rows(model, records, user.get("role"), required)
+    rejected += clean_errors
+    rows = []
+    if batch:
+        rows, prepare_errors = await prepare(session, user, batch)
+        rejected += prepare_errors
+    inserted_rows = []
+    if rows:
+        inserted_rows = await insert_batch(
+            session, model, rows, lambda line_number, error: rejected.append((line_number, error))
+        )
+        if on_insert and inserted_rows:
+            await on_insert(session, inserted_rows)
+    return len(inserted_rows), sorted(rejected, key=lambda item: item[0])
+
+
+async def bulk_import(request: Request, model, required: tuple[str, ...], prepare, on_insert=None) -> JSONResponse:
+    # prepare(session, user, rows) -> (rows to insert, errors) completes a batch of valid rows,
+    # on_insert(session, rows) runs in the same transaction after each batch insert
+    content_type = request.headers.get("Content-Type", "")
+    if "csv" not in content_type and "ndjson" not in content_type:
+        return JSONResponse({"error": "Expected a text/csv or application/x-ndjson body"}, status_code=415)
+
+    user = request.state.jwt_payload
+    inserted = 0
+    errors = []
+    error_count = 0
+
+    def report(line_number: int, error: str) -> None:
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_number, "error": error})
+
+    async def flush(records: list) -> int:
+        count, batch_errors = await import_batch(session, model, records, user, required, prepare, on_insert)
+        for line_number, error in batch_errors:
+            report(line_number, error)
+        return count
+
+    records = []
+    async with request.state.db.begin() as session:
+        async for line_number, row, error in read_records(request, is_csv="csv" in content_type):
+            if error is None and "csv" in content_type:
+                row = csv_values(model, row)
+            records.append((line_number, row, error))
+            if len(records) >= IMPORT_BATCH_SIZE:
+                inserted += await flush(records)
+                records = []
+        if records:
+            inserted += await flush(records)
+    return JSONResponse({"inserted": inserted, "error_count": error_count, "errors": errors})
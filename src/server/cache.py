@@ -0,0 +1,169 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from server.config import RESPONSE_CACHE_SIZE
+from server.streaming import wants_stream
+
+
+class TokenCache:
+    # LRU of already verified JWT: token -> decoded payload
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.tokens = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> dict | None:
+        payload = self.tokens.get(token)
+        if payload is not None:
+            if payload["exp"] > time.time():
+                self.tokens.move_to_end(token)
+                self.hits += 1
+                return payload
+            # expired, jwt.decode will give the error
+            del self.tokens[token]
+        self.misses += 1
+        return None
+
+    def add(self, token: str, payload: dict) -> None:
+        # tokens without expiration are never cached
+        if self.max_size > 0 and "exp" in payload:
+            self.tokens[token] = payload
+            self.tokens.move_to_end(token)
+            if len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self.tokens),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0
+        }
+
+
+class ResponseCache:
+    # LRU of serialized list responses: (path, query) -> (table versions, json body)
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.responses = OrderedDict()
+        # incremented after each committed write on a table
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def table_versions(self, tables: tuple[str, ...]) -> tuple[int, ...]:
+        return tuple(self.versions.get(table, 0) for table in tables)
+
+    def bump(self, *tables: str) -> None:
+        for table in tables:
+            self.versions[table] = self.versions.get(table, 0) + 1
+
+    def get(self, key: tuple, versions: tuple[int, ...]) -> bytes | None:
+        cached = self.responses.get(key)
+        if cached is not None:
+            if cached[0] == versions:
+                self.responses.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            # a table changed since the response was cached
+            del self.responses[key]
+        self.misses += 1
+        return None
+
+    def add(self, key: tuple, versions: tuple[int, ...], body: bytes) -> None:
+        if self.max_size > 0:
+            self.responses[key] = (versions, body)
+            self.responses.move_to_end(key)
+            if len(self.responses) > self.max_size:
+                self.responses.popitem(last=False)
+
+    def clear(self) -> None:
+        self.responses.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self.responses),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+            "not_modified": self.not_modified,
+            "versions": dict(self.versions)
+        }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+# the table versions start again from 0 on each server start
+BOOT_ID = uuid.uuid4().hex
+
+
+def etag(key: tuple, versions: tuple[int, ...]) -> str:
+    digest = hashlib.blake2b(repr((BOOT_ID, key, versions)).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, tag: str) -> bool:
+    if header := request.headers.get("If-None-Match"):
+        if header.strip() == "*":
+            return True
+        return tag in [value.strip().removeprefix("W/") for value in header.split(",")]
+    return False
+
+
+def cached_response(*models, vary=None):
+    # serve a list route from memory until one of the tables it reads is written,
+    # the ETag is derived from the same table versions
+    # vary(request): other value read by the route, part of the cache key
+    tables = tuple(model.__tablename__ for model in models)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request: Request) -> Response:
+            if wants_stream(request):
+                return await func(request)
+            key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+            if vary is not None:
+                key += (vary(request),)
+            # versions read before the query: a write during the query makes the entry stale
+            versions = response_cache.table_versions(tables)
+            tag = etag(key, versions)
+            if etag_matches(request, tag):
+                # the client copy is still valid, nothing to serialize or send
+                response_cache.not_modified += 1
+                return Response(status_code=304, headers={"ETag": tag})
+            body = response_cache.get(key, versions)
+            if body is not None:
+                return Response(body, media_type="application/json", headers={"ETag": tag})
+            response = await func(request)
+            if response.status_code == 200:
+                response_cache.add(key, versions, response.body)
+                response.headers["ETag"] = tag
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_cache(*models):
+    # bump the table versions once the write is committed
+    tables = tuple(model.__tablename__ for model in models)
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(request: Request) -> Response:
+            response = await func(request)
+            if response.status_code == 200:
+                response_cache.bump(*tables)
+            return response
+        return wrapper
+    return decorator
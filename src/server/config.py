@@ -14,11 +14,28 @@ DB_TEST = os.getenv("DB_TEST")
 
 DB_APP_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PWD}@{DB_HOST}/{DB_APP}"
 DB_TEST_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PWD}@{DB_HOST}/{DB_TEST}"
+DB_APP_ASYNC_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PWD}@{DB_HOST}/{DB_APP}"
+DB_TEST_ASYNC_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PWD}@{DB_HOST}/{DB_TEST}"
+
+# connection pool of the application engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+# no pool in the application, connections are pooled by PgBouncer
+DB_NULL_POOL = os.getenv("DB_NULL_POOL", "false").lower() == "true"
 
 USER_NAME = os.getenv("USER_NAME")
 USER_EMAIL = os.getenv("USER_EMAIL")
 USER_PASSWORD = os.getenv("USER_PASSWORD")
 
 SECRET_KEY = os.getenv("SECRET_KEY")
+# number of verified tokens kept in memory by the JWT middleware
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", 1024))
+# number of list responses kept in memory by the server (one uvicorn process)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 256))
+
+# number of threads computing argon2 password hashes
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))
 
 SENTRY_DSN = os.getenv("SENTRY_DSN")
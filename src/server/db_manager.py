@@ -1,17 +1,39 @@
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, Engine, text
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from argon2 import PasswordHasher
 
 from server import config
-from server.models import Base, Role, Collaborator
+from server.models import Base, Role, Collaborator, CommercialBalance, ClientBalance
+from server.rollups import rebuild_statements
+
+
+def pool_options(async_driver=False) -> dict:
+    # engine options for the connection pool from the configuration
+    if config.DB_NULL_POOL:
+        options = {"poolclass": NullPool}
+        if async_driver:
+            # prepared statements do not survive PgBouncer transaction pooling
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        return options
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        "pool_recycle": config.DB_POOL_RECYCLE
+    }
 
 
 class DBManager:
+    # engines and session factories shared by the whole process, created on first use
+    engines = {}
+    session_factories = {}
 
     def __init__(self):
-        ph = PasswordHasher()
         self.db_app = config.DB_APP
         self.db_test = config.DB_TEST
         self.db_root = config.DB_ROOT
@@ -21,16 +43,21 @@ class DBManager:
             "password": config.DB_PWD,
         }
 
-        self.engine = create_engine(config.DB_APP_URL)
-        self.engine_test = create_engine(config.DB_TEST_URL)
+    @property
+    def engine(self) -> Engine:
+        return self._get_engine("app")
 
-        self.first_user = {
-            "name": config.USER_NAME,
-            "email": config.USER_EMAIL,
-            "phone": "0000",
-            "password": ph.hash(config.USER_PASSWORD),
-            "role_id": 1
-        }
+    @property
+    def engine_test(self) -> Engine:
+        return self._get_engine("test")
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        return self._get_engine("async_app")
+
+    @property
+    def async_engine_test(self) -> AsyncEngine:
+        return self._get_engine("async_test")
 
     def init_database(self) -> None:
         print(f"\n ===== Database: {self.db_app} =====")
@@ -57,11 +84,78 @@ class DBManager:
         self.engine_test.dispose()
         self._delete_database(self.db_test)
 
+    # Build the model indexes on an existing database without locking the tables
+    def create_indexes(self, test=False) -> None:
+        print(f"\n ===== Create indexes: {self.db_test if test else self.db_app} =====")
+        engine = self.engine_test if test else self.engine
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # a failed concurrent build leaves an invalid index, drop it to build it again
+            invalid = conn.scalars(text(
+                """
+                SELECT pg_class.relname FROM pg_index
+                JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+                WHERE NOT pg_index.indisvalid
+                """
+            )).all()
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for table in Base.metadata.sorted_tables:
+                for index in sorted(table.indexes, key=lambda index: index.name):
+                    if index.name in invalid:
+                        conn.execute(text(f"DROP INDEX CONCURRENTLY {index.name}"))
+                    statement = CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)
+                    conn.execute(text(str(statement).replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)))
+                    print(f"Index {index.name} ready.")
+
+    # Recompute the contract balances from the contract table, to repair them
+    def rebuild_balances(self, test=False) -> None:
+        print(f"\n ===== Rebuild balances: {self.db_test if test else self.db_app} =====")
+        engine = self.engine_test if test else self.engine
+        Base.metadata.create_all(engine, tables=[CommercialBalance.__table__, ClientBalance.__table__])
+        with engine.begin() as conn:
+            # contracts written during the rebuild would be missed, they wait for the end of the transaction
+            conn.execute(text("LOCK TABLE contract IN SHARE MODE"))
+            for statement in rebuild_statements():
+                conn.execute(statement)
+        print("Balances rebuilt.")
+
     def get_session(self) -> sessionmaker:
-        return sessionmaker(self.engine)
+        return self._get_session_factory("app")
 
     def get_test_session(self) -> sessionmaker:
-        return sessionmaker(self.engine_test)
+        return self._get_session_factory("test")
+
+    def get_async_session(self) -> async_sessionmaker:
+        return self._get_session_factory("async_app")
+
+    def get_async_test_session(self) -> async_sessionmaker:
+        return self._get_session_factory("async_test")
+
+    # Create the engine on first call, then return the same engine
+    def _get_engine(self, name: str) -> Engine | AsyncEngine:
+        if name not in self.engines:
+            match name:
+                case "app":
+                    engine = create_engine(config.DB_APP_URL, **pool_options())
+                case "test":
+                    engine = create_engine(config.DB_TEST_URL)
+                case "async_app":
+                    engine = create_async_engine(config.DB_APP_ASYNC_URL, **pool_options(async_driver=True))
+                case "async_test":
+                    # no pool for tests: the test client may run each request in a new event loop
+                    engine = create_async_engine(config.DB_TEST_ASYNC_URL, poolclass=NullPool)
+            self.engines[name] = engine
+        return self.engines[name]
+
+    # Create the session factory on first call, then return the same factory
+    def _get_session_factory(self, name: str) -> sessionmaker | async_sessionmaker:
+        if name not in self.session_factories:
+            engine = self._get_engine(name)
+            if name.startswith("async"):
+                self.session_factories[name] = async_sessionmaker(engine, expire_on_commit=False)
+            else:
+                self.session_factories[name] = sessionmaker(engine)
+        return self.session_factories[name]
 
     # Try to connect to the database and check if database exist
     def _check_database_exist(self, db_name: str) -> bool:
@@ -89,8 +183,16 @@ class DBManager:
             Role(role="commercial"),
             Role(role="support")
         ]
-        user = Collaborator(**self.first_user)
-        Session = sessionmaker(self.engine_test if test else self.engine)
+        # the password is only hashed when the database is created
+        ph = PasswordHasher()
+        user = Collaborator(
+            name=config.USER_NAME,
+            email=config.USER_EMAIL,
+            phone="0000",
+            password=ph.hash(config.USER_PASSWORD),
+            role_id=1
+        )
+        Session = self.get_test_session() if test else self.get_session()
         try:
             with Session.begin() as session:
                 session.add_all(roles)
@@ -0,0 +1,23 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import argon2
+
+from server.config import HASH_WORKERS
+
+ph = argon2.PasswordHasher()
+
+# argon2-cffi releases the GIL while hashing: the threads run on several cores
+# and the pool size bounds how many hashes are computed at the same time
+executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="argon2")
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, ph.hash, password)
+
+
+async def verify_password(hashed_password: str, password: str) -> bool:
+    # raise argon2.exceptions.VerificationError if the password does not match
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, ph.verify, hashed_password, password)
@@ -1,51 +1,64 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import Headers
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 import jwt
 from sentry_sdk import capture_message
 
-from server.config import SECRET_KEY
+from server.config import SECRET_KEY, JWT_CACHE_SIZE
+from server.cache import TokenCache
 from server.db_manager import DBManager
 
 manager = DBManager()
+token_cache = TokenCache(JWT_CACHE_SIZE)
 
 
-class JWTMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app):
-        super().__init__(app)
+class JWTMiddleware:
+    def __init__(self, app: ASGIApp, public_paths=("/login",)):
+        self.app = app
+        # routes reachable without token
+        self.public_paths = set(public_paths)
 
-    async def dispatch(self, request: Request, call_next):
-        if str(request.url).split("/")[-1] != "login":
-            token = request.headers.get("Authorization")
-            if token:
-                try:
-                    token = token.split(" ")[1]
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.public_paths:
+            await self.app(scope, receive, send)
+            return
+
+        token = Headers(scope=scope).get("Authorization")
+        if token:
+            try:
+                token = token.split(" ")[1]
+                payload = token_cache.get(token)
+                if payload is None:
                     payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-                    request.state.jwt_payload = payload
-                except jwt.ExpiredSignatureError:
-                    return JSONResponse({"error": "Token expired"}, status_code=401)
-                except jwt.InvalidTokenError:
-                    capture_message("Invalid token", "warning")
-                    return JSONResponse({"error": "Invalid token"}, status_code=401)
-                else:
-                    response = await call_next(request)
-                    return response
+                    token_cache.add(token, payload)
+            except jwt.ExpiredSignatureError:
+                response = JSONResponse({"error": "Token expired"}, status_code=401)
+            except (jwt.InvalidTokenError, IndexError):
+                capture_message("Invalid token", "warning")
+                response = JSONResponse({"error": "Invalid token"}, status_code=401)
             else:
-                return JSONResponse({"error": "No connected !"}, status_code=401)
+                # read in the handlers with request.state.jwt_payload
+                scope.setdefault("state", {})["jwt_payload"] = payload
+                await self.app(scope, receive, send)
+                return
         else:
-            response = await call_next(request)
-            return response
-
+            response = JSONResponse({"error": "No connected !"}, status_code=401)
+        await response(scope, receive, send)
 
-class DatabaseMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, dispatch=None, testing=False):
-        super().__init__(app, dispatch)
-        self.testing = testing
 
-    async def dispatch(self, request: Request, call_next):
-        if self.testing:
-            request.state.db = manager.get_test_session()
+class DatabaseMiddleware:
+    def __init__(self, app: ASGIApp, testing=False, skip_paths=("/session", "/metrics")):
+        self.app = app
+        # routes which never use the database
+        self.skip_paths = set(skip_paths)
+        # one session factory shared by all requests
+        if testing:
+            self.session_factory = manager.get_async_test_session()
         else:
-            request.state.db = manager.get_session()
-        response = await call_next(request)
-        return response
+            self.session_factory = manager.get_async_session()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"] not in self.skip_paths:
+            # read in the handlers with request.state.db
+            scope.setdefault("state", {})["db"] = self.session_factory
+        await self.app(scope, receive, send)
@@ -1,6 +1,8 @@
 import datetime
 
-from sqlalchemy import ForeignKey, String, DateTime, Date, Integer, Text, Float, Boolean, UniqueConstraint
+from sqlalchemy import (
+    ForeignKey, String, DateTime, Date, Integer, Text, Float, Boolean, UniqueConstraint, Index, text, event, DDL
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from typing import Optional
 from sqlalchemy.sql import func
@@ -10,6 +12,11 @@ class Base(DeclarativeBase):
     pass
 
 
+# trigram operators and indexes used by the client search
+TRIGRAM_EXTENSION = DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+event.listen(Base.metadata, "before_create", TRIGRAM_EXTENSION.execute_if(dialect="postgresql"))
+
+
 class Collaborator(Base):
     __tablename__ = "collaborator"
 
@@ -57,6 +64,16 @@ class Client(Base):
     contracts: Mapped[list["Contract"]] = relationship(back_populates="client")
     events: Mapped["Event"] = relationship(back_populates="client")
 
+    # list filters, sorted by id for the pagination
+    __table_args__ = (
+        Index("ix_client_commercial_id", "commercial_id", "id"),
+        Index("ix_client_unassigned", "id", postgresql_where=text("commercial_id IS NULL")),
+        # search: substring and fuzzy matches on name, company and email
+        Index("ix_client_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_client_company_trgm", "company", postgresql_using="gin", postgresql_ops={"company": "gin_trgm_ops"}),
+        Index("ix_client_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+    )
+
     def __str__(self):
         return self.name
 
@@ -77,6 +94,14 @@ class Contract(Base):
     commercial: Mapped[Optional["Collaborator"]] = relationship(back_populates="contracts")
     event: Mapped["Event"] = relationship(back_populates="contract")
 
+    # list filters, sorted by id for the pagination
+    __table_args__ = (
+        Index("ix_contract_commercial_id", "commercial_id", "id"),
+        Index("ix_contract_client_id", "client_id"),
+        Index("ix_contract_no_signed", "id", postgresql_where=text("status = false")),
+        Index("ix_contract_debtor", "id", postgresql_where=text("remaining_to_pay > 0")),
+    )
+
     def __str__(self):
         return self.id
 
@@ -98,7 +123,31 @@ class Event(Base):
     support: Mapped[Optional["Collaborator"]] = relationship(back_populates="supports")
     contract: Mapped["Contract"] = relationship(back_populates="event")
 
-    __table_args__ = (UniqueConstraint("contract_id"),)
+    __table_args__ = (
+        UniqueConstraint("contract_id"),
+        # list filters, sorted by id for the pagination
+        Index("ix_event_support_id", "support_id", "id"),
+        Index("ix_event_no_support", "id", postgresql_where=text("support_id IS NULL")),
+    )
 
     def __str__(self):
         return self.id
+
+
+# contract totals per commercial and per client, kept up to date by the routes writing contracts
+class CommercialBalance(Base):
+    __tablename__ = "commercial_balance"
+
+    commercial_id: Mapped[int] = mapped_column(ForeignKey("collaborator.id", ondelete="CASCADE"), primary_key=True)
+    contracts: Mapped[int] = mapped_column(Integer, default=0)
+    total_cost: Mapped[float] = mapped_column(Float, default=0)
+    remaining_to_pay: Mapped[float] = mapped_column(Float, default=0)
+
+
+class ClientBalance(Base):
+    __tablename__ = "client_balance"
+
+    client_id: Mapped[int] = mapped_column(ForeignKey("client.id", ondelete="CASCADE"), primary_key=True)
+    contracts: Mapped[int] = mapped_column(Integer, default=0)
+    total_cost: Mapped[float] = mapped_column(Float, default=0)
+    remaining_to_pay: Mapped[float] = mapped_column(Float, default=0)
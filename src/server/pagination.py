@@ -0,0 +1,40 @@
+from sqlalchemy import Select
+from starlette.datastructures import QueryParams
+
+from server.permissions import InvalidQueryParameter
+
+MAX_LIMIT = 500
+
+
+def query_int(params: QueryParams, key: str, default=None, minimum=0) -> int | None:
+    value = params.get(key)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise InvalidQueryParameter(f"{key} must be a number")
+    if number < minimum:
+        raise InvalidQueryParameter(f"{key} must be at least {minimum}")
+    return number
+
+
+def paginate(stmt: Select, id_column, params: QueryParams) -> tuple[Select, int | None]:
+    # keyset pagination: ?limit=<n>&after=<last id of the previous page>
+    stmt = stmt.order_by(id_column)
+    if after := query_int(params, "after"):
+        stmt = stmt.where(id_column > after)
+    limit = query_int(params, "limit", minimum=1)
+    if limit is not None:
+        limit = min(limit, MAX_LIMIT)
+        # one extra row tells if a next page exists
+        stmt = stmt.limit(limit + 1)
+    return stmt, limit
+
+
+def split_page(rows: list, limit: int | None) -> tuple[list, int | None]:
+    # return the rows of the page and the cursor of the next page
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
@@ -0,0 +1,36 @@
+from sqlalchemy import Select
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from server.pagination import split_page
+from server.permissions import InvalidQueryParameter
+from server.streaming import wants_stream, ndjson_response
+
+
+def requested_fields(request: Request, projection: dict) -> list[str] | None:
+    # ?fields=id,name,company -> ["id", "name", "company"], id is always returned
+    if fields := request.query_params.get("fields"):
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        if any(name not in projection for name in names):
+            raise InvalidQueryParameter("Unknown field")
+        if "id" not in names:
+            names.insert(0, "id")
+        return names
+
+
+async def projection_response(
+        request: Request,
+        stmt: Select,
+        projection: dict,
+        fields: list[str],
+        key: str,
+        limit: int | None
+) -> Response:
+    # select only the requested columns, rows are plain tuples without ORM entities
+    stmt = stmt.with_only_columns(*[projection[field].label(field) for field in fields])
+    if wants_stream(request):
+        return ndjson_response(request, stmt.limit(limit), dict, projected=True)
+    async with request.state.db.begin() as session:
+        rows, next_cursor = split_page((await session.execute(stmt)).all(), limit)
+        data = [row._asdict() for row in rows]
+    return JSONResponse({key: data, "next_cursor": next_cursor})
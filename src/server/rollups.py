@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from sqlalchemy import Select, select, func, delete, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from server.models import Contract, CommercialBalance, ClientBalance
+
+BALANCE_COLUMNS = ["contracts", "total_cost", "remaining_to_pay"]
+# balance model -> contract column used as key
+BALANCES = {
+    CommercialBalance: "commercial_id",
+    ClientBalance: "client_id"
+}
+
+
+def contract_values(contract: Contract) -> dict:
+    # what a contract adds to the balances, compared before and after an update
+    return {
+        "client_id": contract.client_id,
+        "commercial_id": contract.commercial_id,
+        "total_cost": contract.total_cost,
+        "remaining_to_pay": contract.remaining_to_pay
+    }
+
+
+def contract_totals(client_id: int) -> Select:
+    # totals of the contracts of a client per commercial, same keys as contract_values() plus the count
+    return (
+        select(
+            Contract.client_id,
+            Contract.commercial_id,
+            func.count().label("contracts"),
+            func.sum(Contract.total_cost).label("total_cost"),
+            func.sum(Contract.remaining_to_pay).label("remaining_to_pay")
+        )
+        .where(Contract.client_id == client_id)
+        .group_by(Contract.client_id, Contract.commercial_id)
+    )
+
+
+async def update_balances(session, added=(), removed=()) -> None:
+    # contracts (dicts with client_id, commercial_id, total_cost, remaining_to_pay and optional contracts count)
+    # added to or removed from the balances, in the transaction of the session
+    for model, key in BALANCES.items():
+        deltas = defaultdict(lambda: [0, 0, 0])
+        for sign, contracts in [(1, added), (-1, removed)]:
+            for contract in contracts:
+                if contract[key] is None:
+                    continue
+                delta = deltas[contract[key]]
+                delta[0] += sign * contract.get("contracts", 1)
+                delta[1] += sign * contract["total_cost"]
+                delta[2] += sign * contract["remaining_to_pay"]
+        # sorted keys: concurrent transactions lock the balance rows in the same order
+        rows = [
+            {key: key_value, **dict(zip(BALANCE_COLUMNS, delta))}
+            for key_value, delta in sorted(deltas.items()) if any(delta)
+        ]
+        if rows:
+            stmt = pg_insert(model).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[key],
+                set_={column: getattr(model, column) + stmt.excluded[column] for column in BALANCE_COLUMNS}
+            )
+            await session.execute(stmt)
+
+
+def rebuild_statements() -> list:
+    # full recomputation from the contract table, to repair the balances
+    statements = []
+    for model, key in BALANCES.items():
+        key_column = getattr(Contract, key)
+        totals = (
+            select(
+                key_column,
+                func.count(),
+                func.coalesce(func.sum(Contract.total_cost), 0),
+                func.coalesce(func.sum(Contract.remaining_to_pay), 0)
+            )
+            .where(key_column.is_not(None))
+            .group_by(key_column)
+        )
+        statements.append(delete(model))
+        statements.append(insert(model).from_select([key, *BALANCE_COLUMNS], totals))
+    return statements
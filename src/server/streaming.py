@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+
+from sqlalchemy import Select
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from sentry_sdk import capture_exception
+
+NDJSON = "application/x-ndjson"
+CHUNK_SIZE = 500
+
+
+def wants_stream(request: Request) -> bool:
+    # streaming mode is selected with ?stream=1 or the "Accept: application/x-ndjson" header
+    return request.query_params.get("stream") == "1" or NDJSON in request.headers.get("accept", "")
+
+
+def ndjson_response(request: Request, stmt: Select, serialize, projected=False) -> StreamingResponse:
+    async def rows():
+        try:
+            # yield_per reads the rows from a server-side cursor, CHUNK_SIZE rows at a time
+            async with request.state.db.begin() as session:
+                result = await session.stream(stmt.execution_options(yield_per=CHUNK_SIZE))
+                async for row in result.mappings() if projected else result.scalars():
+                    yield json.dumps(serialize(row), ensure_ascii=False) + "\n"
+        except Exception as err:
+            # the 200 is already sent, a last record tells the client that the list is incomplete
+            capture_exception(err)
+            yield json.dumps({"error": "Internal error"}) + "\n"
+
+    return StreamingResponse(rows(), media_type=NDJSON)
+
+
+def csv_response(request: Request, stmt: Select, filename: str) -> StreamingResponse:
+    async def rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        try:
+            async with request.state.db.begin() as session:
+                result = await session.stream(stmt.execution_options(yield_per=CHUNK_SIZE))
+                writer.writerow(result.keys())
+                # one chunk of CSV text per partition of CHUNK_SIZE rows
+                async for partition in result.partitions():
+                    writer.writerows(partition)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        except Exception as err:
+            # no error line in a CSV file: the connection is aborted before the last chunk,
+            # the client gets an incomplete body instead of a truncated file with a 200
+            capture_exception(err)
+            raise
+        yield buffer.getvalue()
+
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
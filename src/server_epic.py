@@ -6,6 +6,9 @@ from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 from server.config import SENTRY_DSN
 from server.api_collab import CollabAPI
 from server.api_work import ClientAPI, ContractAPI, EventAPI
+from server.api_metrics import MetricsAPI
+from server.api_export import ExportAPI
+from server.api_stats import StatsAPI
 from server.middlewares import JWTMiddleware, DatabaseMiddleware
 
 sentry_sdk.init(
@@ -18,7 +21,10 @@ api_routes = [
     CollabAPI.get_routes(),
     ClientAPI.get_routes(),
     ContractAPI.get_routes(),
-    EventAPI.get_routes()
+    EventAPI.get_routes(),
+    MetricsAPI.get_routes(),
+    ExportAPI.get_routes(),
+    StatsAPI.get_routes()
 ]
 
 
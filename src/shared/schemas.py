@@ -0,0 +1,147 @@
+import re
+
+# validation rules shared by the API (JSON values) and the CLI (typed text), compiled once at import
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
+DATE_PATTERN = re.compile(r"^(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/\d{4}$")
+DATETIME_PATTERN = re.compile(
+    r"^(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/(20[2-9][0-9]) ([01][0-9]|2[0-3]):([0-5][0-9])$"
+)
+
+
+def string(max_length: int | None = None):
+    # max_length: size of the String column, longer values are rejected before the database
+    return lambda value: isinstance(value, str) and (max_length is None or len(value) <= max_length)
+
+
+def digits(max_length: int):
+    return lambda value: isinstance(value, str) and value.isdigit() and len(value) <= max_length
+
+
+def is_positive_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def is_bool(value) -> bool:
+    return isinstance(value, bool)
+
+
+def matches(pattern: re.Pattern, max_length: int | None = None):
+    return lambda value: (
+        isinstance(value, str)
+        and (max_length is None or len(value) <= max_length)
+        and pattern.match(value) is not None
+    )
+
+
+def min_length(length: int):
+    return lambda value: isinstance(value, str) and len(value) >= length
+
+
+def one_of(*choices):
+    return lambda value: is_positive_int(value) and value in choices
+
+
+def parse_int(text: str) -> int:
+    if not text.isdigit():
+        raise ValueError(f"not a positive number: {text}")
+    return int(text)
+
+
+def parse_bool(text: str) -> bool:
+    if text not in ["0", "1"]:
+        raise ValueError(f"expected 0 or 1: {text}")
+    return text == "1"
+
+
+class Field:
+    # check(value) -> bool for the API values, parse(text) -> value for the CLI input (text kept when None)
+    def __init__(self, check, parse=None):
+        self.check = check
+        self.parse = parse
+
+
+FIELDS = {
+    "name": Field(string(50)),
+    "company": Field(string(255)),
+    "event_title": Field(string(255)),
+    "location": Field(string(255)),
+    "note": Field(string()),
+    "email": Field(matches(EMAIL_PATTERN, 255)),
+    "phone": Field(digits(20)),
+    "password": Field(min_length(6)),
+    "role_id": Field(one_of(1, 2, 3), parse_int),
+    "client_id": Field(is_positive_int, parse_int),
+    "commercial_id": Field(is_positive_int, parse_int),
+    "contract_id": Field(is_positive_int, parse_int),
+    "support_id": Field(is_positive_int, parse_int),
+    "total_cost": Field(is_positive_int, parse_int),
+    "remaining_to_pay": Field(is_positive_int, parse_int),
+    "attendees": Field(is_positive_int, parse_int),
+    "date": Field(matches(DATE_PATTERN)),
+    "event_start": Field(matches(DATETIME_PATTERN)),
+    "event_end": Field(matches(DATETIME_PATTERN)),
+    "status": Field(is_bool, parse_bool)
+}
+
+# fields each role can write, per table
+PERMISSIONS = {
+    "collaborator": {
+        "gestion": ["name", "email", "phone", "password", "role_id"]
+    },
+    "client": {
+        "commercial": ["name", "email", "phone", "company"],
+        "gestion": ["commercial_id"]
+    },
+    "contract": {
+        "gestion": ["client_id", "total_cost", "event_title", "remaining_to_pay", "date", "status"],
+        "commercial": ["total_cost", "remaining_to_pay", "date", "status"]
+    },
+    "event": {
+        "gestion": ["support_id"],
+        "commercial": ["support_id", "contract_id", "event_start", "event_end", "location", "attendees", "note"],
+        "support": ["event_start", "event_end", "location", "attendees", "note"]
+    }
+}
+
+# (table, role) -> {field: Field}
+SCHEMAS = {
+    (table, role): {field: FIELDS[field] for field in fields}
+    for table, roles in PERMISSIONS.items()
+    for role, fields in roles.items()
+}
+
+
+def check_record(schema: dict, record: dict) -> dict | None:
+    for field, value in record.items():
+        rule = schema.get(field)
+        if rule is None:
+            return {"error": f"Invalid field: {field}"}
+        if not rule.check(value):
+            return {"error": f"Invalid value for field: {field}"}
+    if record:
+        return dict(record)
+
+
+def validate(table: str, role: str, record: dict) -> dict | None:
+    # the record, an {"error": ...} dict, or None when the role cannot write this table or the record is empty
+    if schema := SCHEMAS.get((table, role)):
+        return check_record(schema, record)
+
+
+def validate_many(table: str, role: str, records: list[dict]) -> list[dict | None]:
+    # same results as validate() for each record, the schema is looked up once
+    if schema := SCHEMAS.get((table, role)):
+        return [check_record(schema, record) for record in records]
+    return [None] * len(records)
+
+
+def parse_input(field: str, text: str):
+    # CLI text -> value checked with the API rule, ValueError when invalid
+    rule = FIELDS.get(field)
+    if rule is None:
+        return text
+    value = rule.parse(text) if rule.parse else text
+    if not rule.check(value):
+        raise ValueError(f"invalid value for field {field}")
+    return value
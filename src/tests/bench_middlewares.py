@@ -0,0 +1,102 @@
+# Micro-benchmark of the per-request overhead of the API middlewares.
+# Compare the previous BaseHTTPMiddleware classes with the pure ASGI ones.
+# Run from the src folder: python -m tests.bench_middlewares
+import asyncio
+import datetime
+import time
+
+import jwt
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from server.config import SECRET_KEY
+from server.middlewares import JWTMiddleware, DatabaseMiddleware, manager
+
+ITERATIONS = 5000
+
+
+class BaseHTTPJWTMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        if str(request.url).split("/")[-1] != "login":
+            token = request.headers.get("Authorization")
+            if token:
+                try:
+                    payload = jwt.decode(token.split(" ")[1], SECRET_KEY, algorithms=["HS256"])
+                    request.state.jwt_payload = payload
+                except jwt.InvalidTokenError:
+                    return JSONResponse({"error": "Invalid token"}, status_code=401)
+                return await call_next(request)
+            return JSONResponse({"error": "No connected !"}, status_code=401)
+        return await call_next(request)
+
+
+class BaseHTTPDatabaseMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request.state.db = manager.get_async_session()
+        return await call_next(request)
+
+
+async def endpoint(request: Request) -> JSONResponse:
+    return JSONResponse({"id": request.state.jwt_payload.get("id")})
+
+
+def create_app(jwt_middleware, db_middleware) -> Starlette:
+    app = Starlette(routes=[Route("/session", endpoint), Route("/collab", endpoint)])
+    app.add_middleware(jwt_middleware)
+    app.add_middleware(db_middleware)
+    return app
+
+
+async def measure(app: Starlette, path: str, token: str) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(100):
+        await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await app(dict(scope), receive, send)
+    # microseconds per request
+    return (time.perf_counter() - start) / ITERATIONS * 1_000_000
+
+
+async def main() -> None:
+    token = jwt.encode(
+        {
+            "id": 1,
+            "role": "gestion",
+            "exp": datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(hours=1)
+        },
+        SECRET_KEY,
+        algorithm="HS256"
+    )
+    before = create_app(BaseHTTPJWTMiddleware, BaseHTTPDatabaseMiddleware)
+    after = create_app(JWTMiddleware, DatabaseMiddleware)
+    print(f"{'route':<10}{'before (µs)':>14}{'after (µs)':>14}")
+    for path in ["/session", "/collab"]:
+        print(f"{path:<10}{await measure(before, path, token):>14.1f}{await measure(after, path, token):>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,22 @@
+import csv
+import io
+import json
+
 import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
 from starlette.testclient import TestClient
 from starlette.applications import Starlette
 
 from server.api_collab import CollabAPI
 from server.api_work import ClientAPI, ContractAPI, EventAPI
+from server.api_metrics import MetricsAPI
+from server.api_export import ExportAPI
+from server.api_stats import StatsAPI
 from server.db_manager import DBManager
 from server.middlewares import JWTMiddleware, DatabaseMiddleware
+from server.cache import response_cache
 
 
 manager = DBManager()
@@ -17,7 +28,10 @@ def create_test_app():
         CollabAPI.get_routes(),
         ClientAPI.get_routes(),
         ContractAPI.get_routes(),
-        EventAPI.get_routes()
+        EventAPI.get_routes(),
+        MetricsAPI.get_routes(),
+        ExportAPI.get_routes(),
+        StatsAPI.get_routes()
     ]
 
     all_routes = []
@@ -187,6 +201,20 @@ class TestApi:
         assert res.status_code == 401
         assert res.json() == {"error": "Invalid token"}
 
+    def test_get_collaborator_with_malformed_authorization_header(self, client):
+        url = base_url + "/collab"
+        res = client.get(url, headers={"Authorization": "token-without-scheme"})
+        assert res.status_code == 401
+        assert res.json() == {"error": "Invalid token"}
+
+    def test_jwt_cache_metrics(self, client, gestion_user):
+        header = self._header_with_auth(client, gestion_user)
+        client.get(base_url + "/collab", headers=header)
+        res = client.get(base_url + "/metrics", headers=header)
+        assert res.status_code == 200
+        assert res.json()["jwt_cache"]["hits"] >= 1
+        assert "response_cache" in res.json()
+
     # _____Tests for create collaborator and for role permissions_____
 
     def test_create_new_collab_with_valid_role(self, client, gestion_user, commercial_user):
@@ -222,7 +250,8 @@ class TestApi:
             headers=self._header_with_auth(client, gestion_user)
         )
         assert res.status_code == 200
-        assert res.json() == {"status": "Collaborator updated"}
+        assert res.json()["status"] == "Collaborator updated"
+        assert res.json()["collaborator"]["phone"] == "22222222"
 
     def test_update_collaborator_with_invalid_field(self, client, gestion_user):
         url = base_url + "/collab/update/1"
@@ -248,7 +277,7 @@ class TestApi:
 
     def test_delete_collaborator_with_invalid_url_id(self, client, gestion_user):
         url = base_url + "/collab/delete/3"
-        res = client.get(
+        res = client.post(
             url,
             headers=self._header_with_auth(client, gestion_user)
         )
@@ -257,7 +286,7 @@ class TestApi:
 
     def test_delete_collaborator_with_valid_url_id(self, client, gestion_user):
         url = base_url + "/collab/delete/2"
-        res = client.get(
+        res = client.post(
             url,
             headers=self._header_with_auth(client, gestion_user)
         )
@@ -288,6 +317,43 @@ class TestApi:
         assert res.status_code == 200
         assert len(res.json().get("clients")) == 1
 
+    def test_get_client_paginated(self, client, commercial_user):
+        header = self._header_with_auth(client, commercial_user)
+        res = client.get(base_url + "/client?limit=1", headers=header)
+        assert res.status_code == 200
+        assert len(res.json().get("clients")) == 1
+        assert res.json().get("next_cursor") is None
+
+        res = client.get(base_url + "/client?after=1", headers=header)
+        assert res.status_code == 200
+        assert res.json().get("clients") == []
+
+    def test_get_client_with_invalid_limit(self, client, commercial_user):
+        res = client.get(
+            base_url + "/client?limit=abc",
+            headers=self._header_with_auth(client, commercial_user)
+        )
+        assert res.status_code == 400
+        assert res.json() == {"error": "Invalid query parameter"}
+
+    def test_get_client_with_fields(self, client, commercial_user):
+        res = client.get(
+            base_url + "/client?fields=name,company",
+            headers=self._header_with_auth(client, commercial_user)
+        )
+        assert res.status_code == 200
+        assert res.json().get("clients") == [
+            {"id": 1, "name": "client 1", "company": "client1 company"}
+        ]
+
+    def test_get_client_with_unknown_field(self, client, commercial_user):
+        res = client.get(
+            base_url + "/client?fields=name,password",
+            headers=self._header_with_auth(client, commercial_user)
+        )
+        assert res.status_code == 400
+        assert res.json() == {"error": "Invalid query parameter"}
+
     def test_update_client(self, client, commercial_user):
         url = base_url + "/client/update/1"
         res = client.post(
@@ -296,7 +362,31 @@ class TestApi:
             headers=self._header_with_auth(client, commercial_user)
         )
         assert res.status_code == 200
-        assert res.json() == {"status": "Client updated"}
+        assert res.json()["status"] == "Client updated"
+        assert res.json()["client"]["company"] == "new name company"
+        assert res.json()["client"]["update_date"] != "never updated"
+
+    def test_get_one_client(self, client, commercial_user):
+        header = self._header_with_auth(client, commercial_user)
+        res = client.get(base_url + "/client/1", headers=header)
+        assert res.status_code == 200
+        assert res.json()["client"]["company"] == "new name company"
+        res = client.get(base_url + "/client/999", headers=header)
+        assert res.status_code == 404
+        assert res.json() == {"error": "Invalid client id"}
+
+    def test_search_clients(self, client, commercial_user):
+        header = self._header_with_auth(client, commercial_user)
+        res = client.get(base_url + "/client/search?q=NAME%20COMP", headers=header)
+        assert res.status_code == 200
+        assert [row["id"] for row in res.json()["clients"]] == [1]
+        # fuzzy match on a misspelled word
+        res = client.get(base_url + "/client/search?q=clent", headers=header)
+        assert [row["id"] for row in res.json()["clients"]] == [1]
+        res = client.get(base_url + "/client/search?q=zzzz", headers=header)
+        assert res.json()["clients"] == []
+        res = client.get(base_url + "/client/search?q=cl", headers=header)
+        assert res.status_code == 400
 
     # _____Test for contract_____
 
@@ -310,6 +400,15 @@ class TestApi:
         assert res.status_code == 200
         assert res.json() == {"status": "contract created"}
 
+    def test_create_contract_with_impossible_date(self, client, gestion_user, contract_data):
+        res = client.post(
+            base_url + "/contract/create",
+            json={**contract_data, "date": "31/02/2025"},
+            headers=self._header_with_auth(client, gestion_user)
+        )
+        assert res.status_code == 400
+        assert res.json() == {"error": "Invalid value"}
+
     def test_get_contract(self, client, commercial_user):
         url = base_url + "/contract"
         res = client.get(
@@ -327,7 +426,48 @@ class TestApi:
             headers=self._header_with_auth(client, commercial_user)
         )
         assert res.status_code == 200
-        assert res.json() == {"status": "Contract updated"}
+        assert res.json()["status"] == "Contract updated"
+        assert res.json()["contract"]["status"] is True
+
+    def test_batch_update_contracts(self, client, commercial_user):
+        url = base_url + "/contract/update"
+        res = client.post(
+            url,
+            json=[
+                {"id": 1, "changes": {"remaining_to_pay": 100, "total_cost": 1500}},
+                {"id": 999, "changes": {"status": True}},
+                {"id": 1, "changes": {"event_title": "not allowed"}},
+                {"changes": {}},
+                {"id": 1, "changes": {"date": "31/02/2025"}}
+            ],
+            headers=self._header_with_auth(client, commercial_user)
+        )
+        assert res.status_code == 200
+        results = res.json()["results"]
+        assert [result["status_code"] for result in results] == [200, 400, 400, 400, 400]
+        assert results[0]["contract"]["remaining_to_pay"] == 100
+        assert results[0]["contract"]["total_cost"] == 1500
+        assert results[1]["error"] == "Invalid contract"
+        assert results[2]["error"] == "Invalid field: event_title"
+        # an impossible date only fails its own item
+        assert results[4]["error"] == "Invalid value"
+
+    def test_batch_update_not_a_list(self, client, commercial_user):
+        res = client.post(
+            base_url + "/contract/update",
+            json={"id": 1, "changes": {"status": True}},
+            headers=self._header_with_auth(client, commercial_user)
+        )
+        assert res.status_code == 400
+
+    def test_client_balance(self, client, gestion_user, commercial_user):
+        res = client.get(base_url + "/balance/client/1", headers=self._header_with_auth(client, commercial_user))
+        assert res.status_code == 200
+        assert res.json()["balance"] == {"id": 1, "contracts": 1, "total_cost": 1500, "remaining_to_pay": 100}
+        res = client.get(base_url + "/balance/client/999", headers=self._header_with_auth(client, commercial_user))
+        assert res.status_code == 401
+        res = client.get(base_url + "/balance/unknown/1", headers=self._header_with_auth(client, gestion_user))
+        assert res.status_code == 404
 
     # _____Test for event_____
 
@@ -350,6 +490,98 @@ class TestApi:
         assert res.status_code == 200
         assert len(res.json().get("events")) == 1
 
+    def test_get_event_streamed(self, client, commercial_user):
+        header = self._header_with_auth(client, commercial_user)
+        res = client.get(base_url + "/event?stream=1", headers=header)
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("application/x-ndjson")
+        events = [json.loads(line) for line in res.text.splitlines()]
+        assert len(events) == 1
+
+        header["Accept"] = "application/x-ndjson"
+        res = client.get(base_url + "/event", headers=header)
+        assert res.headers["content-type"].startswith("application/x-ndjson")
+
+    def test_stats(self, client, gestion_user, commercial_user):
+        res = client.get(base_url + "/stats", headers=self._header_with_auth(client, gestion_user))
+        assert res.status_code == 200
+        commercial = next(row for row in res.json()["commercials"] if row["name"] == "collab 1")
+        assert commercial["outstanding"] == 100
+        assert commercial["debtor_contracts"] == 1
+        assert commercial["events_without_support"] == 0
+        assert res.json()["totals"]["outstanding"] == 100
+        res = client.get(base_url + "/stats", headers=self._header_with_auth(client, commercial_user))
+        assert res.status_code == 401
+
+    @pytest.mark.parametrize("filter, predicate", [
+        ("debtor", "contract.remaining_to_pay > 0"),
+        ("no_signed", "contract.status = false")
+    ])
+    def test_contract_filter_matches_partial_index(self, filter, predicate):
+        sql = str(ContractAPI.filtered({filter: ""}).compile(dialect=postgresql.dialect()))
+        assert predicate in sql
+
+    def test_export_contracts_csv(self, client, commercial_user):
+        header = self._header_with_auth(client, commercial_user)
+        res = client.get(base_url + "/export/contract?fields=client,commercial,total_cost", headers=header)
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("text/csv")
+        rows = list(csv.reader(io.StringIO(res.text)))
+        assert rows[0] == ["id", "client", "commercial", "total_cost"]
+        assert len(rows) == 2
+        assert rows[1][1] == "client 1"
+
+        res = client.get(base_url + "/export/contract?no_signed", headers=header)
+        assert len(res.text.splitlines()) == 1
+        res = client.get(base_url + "/export/unknown", headers=header)
+        assert res.status_code == 404
+
+    # _____Test for list endpoints loading strategy_____
+
+    @pytest.mark.parametrize("route", ["/collab", "/client", "/contract", "/event"])
+    def test_list_served_in_one_query(self, client, commercial_user, route):
+        header = self._header_with_auth(client, commercial_user)
+        response_cache.clear()
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(Engine, "before_cursor_execute", count_statement)
+        try:
+            res = client.get(base_url + route, headers=header)
+        finally:
+            event.remove(Engine, "before_cursor_execute", count_statement)
+        assert res.status_code == 200
+        assert len(statements) == 1
+
+    def test_list_served_from_cache(self, client, commercial_user):
+        header = self._header_with_auth(client, commercial_user)
+        response_cache.clear()
+        first = client.get(base_url + "/contract?no_signed", headers=header)
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(Engine, "before_cursor_execute", count_statement)
+        try:
+            res = client.get(base_url + "/contract?no_signed", headers=header)
+        finally:
+            event.remove(Engine, "before_cursor_execute", count_statement)
+        assert res.status_code == 200
+        assert res.json() == first.json()
+        assert len(statements) == 0
+
+    def test_list_not_modified_with_etag(self, client, commercial_user):
+        header = self._header_with_auth(client, commercial_user)
+        res = client.get(base_url + "/event?no_support", headers=header)
+        assert res.status_code == 200
+        header["If-None-Match"] = res.headers["ETag"]
+        res = client.get(base_url + "/event?no_support", headers=header)
+        assert res.status_code == 304
+        assert res.content == b""
+
     def test_update_event_support_by_gestion(self, client, gestion_user, support_user):
         # create support user
         url = base_url + "/collab/create"
@@ -369,7 +601,8 @@ class TestApi:
             headers=self._header_with_auth(client, gestion_user)
         )
         assert res.status_code == 200
-        assert res.json() == {"status": "Event updated"}
+        assert res.json()["status"] == "Event updated"
+        assert res.json()["event"]["support"] == support_user["name"]
 
     def test_update_event_by_support(self, client, support_user):
         url = base_url + "/event/update/1"
@@ -379,4 +612,103 @@ class TestApi:
             headers=self._header_with_auth(client, support_user)
         )
         assert res.status_code == 200
-        assert res.json() == {"status": "Event updated"}
+        assert res.json()["status"] == "Event updated"
+        assert res.json()["event"]["attendees"] == 1000
+
+    # _____Tests for bulk import_____
+
+    def test_import_clients_csv(self, client, commercial_user):
+        body = (
+            "name,email,phone,company\r\n"
+            'import 1,import1@gmail.com,1000001,"Import, multi\nline company"\r\n'
+            "import 2,not an email,1000002,Import 2 company\r\n"
+            "import 3,client1@gmail.com,1000003,Import 3 company\r\n"
+            "import 4,import4@gmail.com,1000004\r\n"
+            "import 5,import5@gmail.com,1000005,Import 5 company\r\n"
+        )
+        res = client.post(
+            base_url + "/client/import",
+            content=body.encode(),
+            headers={**self._header_with_auth(client, commercial_user), "Content-Type": "text/csv"}
+        )
+        assert res.status_code == 200
+        assert res.json() == {
+            "inserted": 2,
+            "error_count": 3,
+            "errors": [
+                {"line": 4, "error": "Invalid value for field: email"},
+                {"line": 5, "error": "Integrity error"},
+                {"line": 6, "error": "Wrong number of values"}
+            ]
+        }
+
+    def test_import_contracts_ndjson(self, client, gestion_user, contract_data):
+        rows = [contract_data, {**contract_data, "client_id": 999}, {**contract_data, "status": "yes"}]
+        res = client.post(
+            base_url + "/contract/import",
+            content="\n".join(json.dumps(row) for row in rows).encode(),
+            headers={**self._header_with_auth(client, gestion_user), "Content-Type": "application/x-ndjson"}
+        )
+        assert res.status_code == 200
+        assert res.json()["inserted"] == 1
+        assert res.json()["errors"] == [
+            {"line": 2, "error": "Invalid client"},
+            {"line": 3, "error": "Invalid value for field: status"}
+        ]
+
+    def test_import_event_already_created(self, client, commercial_user, event_data):
+        res = client.post(
+            base_url + "/event/import",
+            content=json.dumps(event_data).encode(),
+            headers={**self._header_with_auth(client, commercial_user), "Content-Type": "application/x-ndjson"}
+        )
+        assert res.status_code == 200
+        assert res.json()["errors"] == [{"line": 1, "error": "Event is already created for this contract"}]
+
+    def test_import_unauthorized_role(self, client, gestion_user):
+        res = client.post(
+            base_url + "/client/import",
+            content=b"name,email,phone,company\n",
+            headers={**self._header_with_auth(client, gestion_user), "Content-Type": "text/csv"}
+        )
+        assert res.status_code == 401
+
+    def test_import_over_long_value(self, client, commercial_user):
+        body = "name,email,phone,company\n" + "n" * 51 + ",long@gmail.com,1000009,Long company\n"
+        res = client.post(
+            base_url + "/client/import",
+            content=body.encode(),
+            headers={**self._header_with_auth(client, commercial_user), "Content-Type": "text/csv"}
+        )
+        assert res.status_code == 200
+        assert res.json() == {
+            "inserted": 0,
+            "error_count": 1,
+            "errors": [{"line": 2, "error": "Invalid value for field: name"}]
+        }
+
+    def test_reassign_portfolio(self, client, gestion_user, commercial_user):
+        header = self._header_with_auth(client, gestion_user)
+        from_id = client.get(base_url + "/session", headers=self._header_with_auth(client, commercial_user)).json()["id"]
+        new_commercial = {**commercial_user, "name": "collab 2", "email": "collab2@gmail.com", "phone": "33333333"}
+        client.post(base_url + "/collab/create", json=new_commercial, headers=header)
+        collabs = client.get(base_url + "/collab?role=commercial", headers=header).json()["collaborators"]
+        to_id = next(collab["id"] for collab in collabs if collab["name"] == "collab 2")
+        balance = client.get(base_url + f"/balance/commercial/{from_id}", headers=header).json()["balance"]
+
+        res = client.post(base_url + f"/collab/delete/{from_id}", headers=header)
+        assert res.status_code == 400
+
+        res = client.post(base_url + "/collab/reassign", json={"from_id": from_id, "to_id": True}, headers=header)
+        assert res.json() == {"error": "Expected two different collaborator ids"}
+        res = client.post(base_url + "/collab/reassign", json={"from_id": from_id, "to_id": to_id}, headers=header)
+        assert res.status_code == 200
+        assert res.json()["clients"] >= 1
+        assert res.json()["contracts"] >= 1
+        moved = client.get(base_url + f"/balance/commercial/{to_id}", headers=header).json()["balance"]
+        assert {**moved, "id": from_id} == balance
+
+        res = client.post(base_url + "/collab/reassign", json={"from_id": to_id, "to_id": 1}, headers=header)
+        assert res.json() == {"error": "Collaborators must have the same role"}
+        res = client.post(base_url + f"/collab/delete/{from_id}", headers=header)
+        assert res.json() == {"status": "Collaborator deleted"}
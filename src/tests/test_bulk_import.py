@@ -0,0 +1,62 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from server.bulk_import import insert_batch, import_batch
+from server.models import Client
+
+
+class TestInsertBatch:
+
+    def test_rows_rejected_by_the_database_reported(self):
+        @asynccontextmanager
+        async def savepoint():
+            yield
+
+        # batch insert, then row by row: ok, value too long, duplicate
+        session = MagicMock()
+        session.begin_nested = savepoint
+        session.execute = AsyncMock(side_effect=[
+            DataError("INSERT", {}, Exception("value too long")),
+            None,
+            DataError("INSERT", {}, Exception("value too long")),
+            IntegrityError("INSERT", {}, Exception("duplicate key"))
+        ])
+        errors = []
+        rows = [(2, {"name": "ok"}), (3, {"name": "n" * 60}), (4, {"name": "duplicate"})]
+
+        inserted = asyncio.run(insert_batch(session, Client, rows, lambda line, error: errors.append((line, error))))
+        assert inserted == [{"name": "ok"}]
+        assert errors == [(3, "Invalid value"), (4, "Integrity error")]
+
+    def test_batch_errors_reported_in_line_order(self):
+        @asynccontextmanager
+        async def savepoint():
+            yield
+
+        # line 5 rejected by the database, line 3 by prepare, lines 2 and 6 by the validation
+        session = MagicMock()
+        session.begin_nested = savepoint
+        session.execute = AsyncMock(side_effect=[
+            IntegrityError("INSERT", {}, Exception("duplicate key")),
+            None,
+            IntegrityError("INSERT", {}, Exception("duplicate key"))
+        ])
+
+        async def prepare(session, user, rows):
+            return [row for row in rows if row[0] != 3], [(3, "Invalid client")]
+
+        records = [
+            (2, {"name": "n" * 60, "email": "a@a.com", "phone": "1", "company": "a"}, None),
+            (3, {"name": "b", "email": "b@b.com", "phone": "2", "company": "b"}, None),
+            (4, {"name": "c", "email": "c@c.com", "phone": "3", "company": "c"}, None),
+            (5, {"name": "d", "email": "d@d.com", "phone": "4", "company": "d"}, None),
+            (6, None, "Wrong number of values")
+        ]
+        inserted, errors = asyncio.run(import_batch(
+            session, Client, records, {"role": "commercial"}, ("name", "email", "phone", "company"), prepare
+        ))
+        assert inserted == 1
+        assert [line for line, _ in errors] == [2, 3, 5, 6]
@@ -0,0 +1,74 @@
+import time
+
+from server.cache import TokenCache, ResponseCache, etag
+
+
+def payload(exp_in: int) -> dict:
+    return {"id": 1, "role": "gestion", "exp": int(time.time()) + exp_in}
+
+
+class TestTokenCache:
+
+    def test_cached_token_hit(self):
+        cache = TokenCache(max_size=2)
+        cache.add("token", payload(3600))
+        assert cache.get("token")["id"] == 1
+        assert cache.get("other") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_expired_token_evicted(self):
+        cache = TokenCache(max_size=2)
+        cache.add("token", payload(-10))
+        assert cache.get("token") is None
+        assert cache.stats()["size"] == 0
+
+    def test_least_recently_used_token_evicted(self):
+        cache = TokenCache(max_size=2)
+        cache.add("token 1", payload(3600))
+        cache.add("token 2", payload(3600))
+        cache.get("token 1")
+        cache.add("token 3", payload(3600))
+        assert cache.get("token 2") is None
+        assert cache.get("token 1") is not None
+        assert cache.get("token 3") is not None
+
+    def test_disabled_cache(self):
+        cache = TokenCache(max_size=0)
+        cache.add("token", payload(3600))
+        assert cache.get("token") is None
+
+
+class TestResponseCache:
+
+    def test_cached_response_hit(self):
+        cache = ResponseCache(max_size=2)
+        versions = cache.table_versions(("client", "collaborator"))
+        cache.add(("/client", ()), versions, b"{}")
+        assert cache.get(("/client", ()), versions) == b"{}"
+        assert cache.get(("/event", ()), versions) is None
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_write_on_table_invalidates_response(self):
+        cache = ResponseCache(max_size=2)
+        tables = ("client", "collaborator")
+        cache.add(("/client", ()), cache.table_versions(tables), b"{}")
+        cache.bump("contract")
+        assert cache.get(("/client", ()), cache.table_versions(tables)) == b"{}"
+        cache.bump("collaborator")
+        assert cache.get(("/client", ()), cache.table_versions(tables)) is None
+        assert cache.stats()["size"] == 0
+
+    def test_least_recently_used_response_evicted(self):
+        cache = ResponseCache(max_size=2)
+        for route in ["/client", "/contract", "/event"]:
+            cache.add((route, ()), (0,), b"{}")
+        assert cache.get(("/client", ()), (0,)) is None
+        assert cache.get(("/event", ()), (0,)) is not None
+
+    def test_etag_changes_with_table_versions(self):
+        key = ("/client", (("unassigned", ""),))
+        assert etag(key, (0, 0)) == etag(key, (0, 0))
+        assert etag(key, (0, 0)) != etag(key, (0, 1))
+        assert etag(key, (0, 0)) != etag(("/client", ()), (0, 0))
@@ -1,9 +1,14 @@
 import os
+import time
 
+import jwt
 import pytest
+import requests
 from unittest.mock import MagicMock
 
-from cli_app.controller import APIBase, Collaborator, Client, Contract, Event
+from cli_app.controller import (
+    APIBase, Collaborator, Client, Contract, Event, Transfer, Stats, PAGE_SIZE, CONNECT_TIMEOUT, READ_TIMEOUT
+)
 
 
 @pytest.fixture
@@ -45,14 +50,24 @@ class TestAPIBase:
         mock_response.status_code = 200
         mock_response.json.return_value = {"status": "success"}
 
-        mocker.patch("cli_app.controller.requests.get", return_value=mock_response)
-        mocker.patch("cli_app.controller.requests.post", return_value=mock_response)
+        mocker.patch("cli_app.controller.APIBase.http.get", return_value=mock_response)
+        mocker.patch("cli_app.controller.APIBase.http.post", return_value=mock_response)
 
         res_get = api_base.request_api("/test")
         res_post = api_base.request_api("/test", data={"some": "data"})
         assert res_get == {"status": "success"}
         assert res_post == {"status": "success"}
 
+    def test_request_api_posts_empty_body(self, mocker, api_base):
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="fake token")
+        mock_get = mocker.patch("cli_app.controller.APIBase.http.get")
+        mock_post = mocker.patch("cli_app.controller.APIBase.http.post", return_value=MagicMock(status_code=200))
+
+        api_base.request_api("/collab/delete/2", data={})
+        # a delete is a POST, never retried by the session
+        assert mock_post.call_args.kwargs["json"] == {}
+        mock_get.assert_not_called()
+
     def test_request_api_without_token(self, mocker, capsys, api_base):
         mocker.patch("cli_app.controller.APIBase._get_token", return_value=None)
 
@@ -66,12 +81,90 @@ class TestAPIBase:
         mock_response.status_code = 400
         mock_response.json.return_value = {"error": "error response"}
 
-        mocker.patch("cli_app.controller.requests.get", return_value=mock_response)
+        mocker.patch("cli_app.controller.APIBase.http.get", return_value=mock_response)
 
         api_base.request_api("/test")
         captured = capsys.readouterr()
         assert "error response" in captured.out
 
+    def test_request_api_reuses_body_when_not_modified(self, mocker, api_base):
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="fake token")
+        first_response = MagicMock(status_code=200, headers={"ETag": '"v1"'}, content=b'{"clients": []}')
+        first_response.json.return_value = {"clients": []}
+        not_modified = MagicMock(status_code=304)
+        mock_get = mocker.patch("cli_app.controller.APIBase.http.get", side_effect=[first_response, not_modified])
+
+        assert api_base.request_api("/client") == {"clients": []}
+        assert api_base.request_api("/client") == {"clients": []}
+        assert mock_get.call_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+
+    def test_request_api_timeout(self, mocker, capsys, api_base):
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="fake token")
+        mock_get = mocker.patch("cli_app.controller.APIBase.http.get", side_effect=requests.exceptions.ReadTimeout)
+
+        assert api_base.request_api("/test") is None
+        assert "Server not responding" in capsys.readouterr().out
+        assert mock_get.call_args.kwargs["timeout"] == (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    def test_user_perm_resolved_from_token(self, mocker, api_client):
+        token = jwt.encode({"id": 3, "role": "commercial", "exp": int(time.time()) + 3600}, "secret")
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="Bearer " + token)
+        mock_request = mocker.patch("cli_app.controller.APIBase.request_api", return_value={"status": "ok"})
+        mocker.patch("cli_app.controller.ViewInput.creation_input", return_value={"name": "client"})
+
+        api_client.create_client()
+        mock_request.assert_called_once_with("/client/create", {"name": "client"})
+
+    def test_user_perm_checked_by_server_near_expiry(self, mocker, capsys, api_client):
+        token = jwt.encode({"id": 3, "role": "commercial", "exp": int(time.time()) + 10}, "secret")
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="Bearer " + token)
+        mock_request = mocker.patch(
+            "cli_app.controller.APIBase.request_api", return_value={"id": 3, "role": "support"}
+        )
+
+        api_client.create_client()
+        mock_request.assert_called_once_with("/session")
+        assert "No authorized" in capsys.readouterr().out
+
+    def test_token_file_read_once(self, mocker, api_base):
+        mock_open = mocker.patch("builtins.open", mocker.mock_open(read_data="Bearer token"))
+        mocker.patch("cli_app.controller.os.path.exists", return_value=True)
+
+        assert api_base._get_token() == "Bearer token"
+        assert api_base._get_token() == "Bearer token"
+        mock_open.assert_called_once()
+
+    def test_update_input_sends_staged_changes(self, mocker, capsys, api_base):
+        clients = {"clients": [{"id": 1, "name": "old", "phone": "01"}, {"id": 2, "name": "other"}], "next_cursor": None}
+        mock_select = mocker.patch("cli_app.controller.ViewSelect")
+        mock_select.return_value.live_show.side_effect = [("name", "old"), ("phone", "01")]
+        mocker.patch.object(api_base.console, "input", side_effect=["new", "02"])
+        mocker.patch("cli_app.controller.Confirm.ask", side_effect=[True, False])
+        mock_request = mocker.patch(
+            "cli_app.controller.APIBase.request_api",
+            return_value={"results": [{
+                "id": 1, "status_code": 200, "status": "Client updated",
+                "client": {"id": 1, "name": "new", "phone": "02", "update_date": "01-02-2025 10:00:00"}
+            }]}
+        )
+
+        api_base.update_input(route="/client", data=clients, id=1)
+        mock_request.assert_called_once_with("/client/update", data=[{"id": 1, "changes": {"name": "new", "phone": "02"}}])
+        assert mock_select.call_args.args[0] == {"clients": [{"id": 1, "name": "new", "phone": "01"}]}
+        # the displayed list shows the row returned by the server
+        assert clients["clients"][0]["update_date"] == "01-02-2025 10:00:00"
+        output = capsys.readouterr().out
+        assert "Client updated" in output
+        assert "01-02-2025 10:00:00" in output
+
+    def test_request_page_with_limit_and_cursor(self, mocker, api_base):
+        mock_request = mocker.patch("cli_app.controller.APIBase.request_api", return_value={"clients": []})
+
+        api_base.request_page("/client")
+        api_base.request_page("/client?unassigned", after=50)
+        mock_request.assert_any_call(f"/client?limit={PAGE_SIZE}")
+        mock_request.assert_any_call(f"/client?unassigned&limit={PAGE_SIZE}&after=50")
+
 
 class TestCollaborator:
 
@@ -83,7 +176,7 @@ class TestCollaborator:
         mock_response.status_code = 200
         mock_response.json.return_value = {"status": "success", "jwt_token": "token test"}
 
-        mocker.patch("cli_app.controller.requests.post", return_value=mock_response)
+        mocker.patch("cli_app.controller.APIBase.http.post", return_value=mock_response)
 
         api_collab.login(email="test@test.com", password="1234")
         captured = capsys.readouterr()
@@ -99,7 +192,7 @@ class TestCollaborator:
         mock_response.status_code = 400
         mock_response.json.return_value = {"error": "invalid"}
 
-        mocker.patch("cli_app.controller.requests.post", return_value=mock_response)
+        mocker.patch("cli_app.controller.APIBase.http.post", return_value=mock_response)
 
         api_collab.login(email="test@test.com", password="1234")
         captured = capsys.readouterr()
@@ -122,6 +215,48 @@ class TestCollaborator:
         assert "No collaborator" in captured.out
 
 
+    def test_reassign_portfolio(self, mocker, capsys, api_collab):
+        mocker.patch("cli_app.controller.APIBase._local_session", return_value={"role": "gestion", "id": 1})
+        request_page = mocker.patch("cli_app.controller.Collaborator.request_page", side_effect=[
+            {"collaborators": [{"id": 2, "name": "collab 1", "email": "c1@mail.com", "role_id": "commercial"}]},
+            {"collaborators": [{"id": 5, "name": "collab 2", "email": "c2@mail.com"}]}
+        ])
+        mocker.patch("cli_app.controller.ViewSelect.live_show", side_effect=[2, 5])
+        mocker.patch("cli_app.controller.Confirm.ask", return_value=True)
+        request_api = mocker.patch("cli_app.controller.Collaborator.request_api", return_value={
+            "status": "Portfolio reassigned", "clients": 3, "contracts": 4, "events": 1
+        })
+        api_collab.reassign_portfolio()
+
+        assert request_page.call_args_list[1].args == ("/collab?fields=id,name,email&role=commercial",)
+        request_api.assert_called_once_with("/collab/reassign", data={"from_id": 2, "to_id": 5})
+        assert "3 clients, 4 contracts, 1 events" in capsys.readouterr().out
+
+    def test_reassign_portfolio_without_targets(self, mocker, capsys, api_collab):
+        mocker.patch("cli_app.controller.APIBase._local_session", return_value={"role": "gestion", "id": 1})
+        mocker.patch("cli_app.controller.Collaborator.request_page", side_effect=[
+            {"collaborators": [{"id": 2, "name": "collab 1", "email": "c1@mail.com", "role_id": "commercial"}]},
+            None
+        ])
+        mocker.patch("cli_app.controller.ViewSelect.live_show", return_value=2)
+        request_api = mocker.patch("cli_app.controller.Collaborator.request_api")
+        api_collab.reassign_portfolio()
+
+        request_api.assert_not_called()
+        assert "No collaborators" in capsys.readouterr().out
+
+    def test_reassign_portfolio_to_same_collaborator(self, mocker, capsys, api_collab):
+        mocker.patch("cli_app.controller.APIBase._local_session", return_value={"role": "gestion", "id": 1})
+        collabs = {"collaborators": [{"id": 2, "name": "collab 1", "email": "c1@mail.com", "role_id": "commercial"}]}
+        mocker.patch("cli_app.controller.Collaborator.request_page", side_effect=[collabs, collabs])
+        mocker.patch("cli_app.controller.ViewSelect.live_show", side_effect=[2, 2])
+        request_api = mocker.patch("cli_app.controller.Collaborator.request_api")
+        api_collab.reassign_portfolio()
+
+        request_api.assert_not_called()
+        assert "Choose a different collaborator" in capsys.readouterr().out
+
+
 class TestWork:
 
     def test_get_client_with_no_client(self, mocker, capsys, api_client):
@@ -131,6 +266,14 @@ class TestWork:
 
         assert "No client" in captured.out
 
+    def test_search_clients_quotes_query(self, mocker, capsys, api_client):
+        mocker.patch("cli_app.controller.Prompt.ask", return_value="acme & co")
+        request_api = mocker.patch("cli_app.controller.Client.request_api", return_value={"clients": []})
+        api_client.search_clients()
+
+        request_api.assert_called_once_with("/client/search?q=acme%20%26%20co")
+        assert "No client found" in capsys.readouterr().out
+
     def test_get_contract_with_no_contract(self, mocker, capsys, api_contract):
         mocker.patch("cli_app.controller.Contract.request_api", return_value={"contracts": []})
         api_contract.get_list()
@@ -144,3 +287,82 @@ class TestWork:
         captured = capsys.readouterr()
 
         assert "No event" in captured.out
+
+
+class TestTransfer:
+
+    def test_import_file_streams_body(self, mocker, capsys, tmp_path):
+        path = tmp_path / "clients.csv"
+        path.write_text("name,email,phone,company\n")
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="fake token")
+        mock_response = MagicMock(status_code=200)
+        mock_response.json.return_value = {"inserted": 1, "error_count": 1, "errors": [{"line": 3, "error": "invalid"}]}
+        mock_post = mocker.patch("cli_app.controller.APIBase.http.post", return_value=mock_response)
+
+        Transfer().import_file("client", str(path))
+        assert mock_post.call_args.kwargs["headers"]["Content-Type"] == "text/csv"
+        assert mock_post.call_args.kwargs["url"].endswith("/client/import")
+        captured = capsys.readouterr()
+        assert "1 client(s) imported" in captured.out
+        assert "line 3: invalid" in captured.out
+
+    def test_import_file_server_error_in_plain_text(self, mocker, capsys, tmp_path):
+        path = tmp_path / "clients.csv"
+        path.write_text("name,email,phone,company\n")
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="fake token")
+        mock_response = MagicMock(status_code=500, text="Internal Server Error")
+        mock_response.json.side_effect = requests.exceptions.JSONDecodeError("Expecting value", "", 0)
+        mocker.patch("cli_app.controller.APIBase.http.post", return_value=mock_response)
+
+        Transfer().import_file("client", str(path))
+        assert "500 Internal Server Error" in capsys.readouterr().out
+
+    def test_import_file_unknown_extension(self, capsys):
+        Transfer().import_file("client", "clients.xlsx")
+        assert "File must be" in capsys.readouterr().out
+
+    def test_export_file_writes_chunks(self, mocker, capsys, tmp_path):
+        path = tmp_path / "contracts.csv"
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="fake token")
+        mock_response = MagicMock(status_code=200)
+        mock_response.iter_content.return_value = [b"id,client\r\n", b"1,client 1\r\n"]
+        mock_get = mocker.patch("cli_app.controller.APIBase.http.get")
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        Transfer().export_file("contract", str(path), ("no_signed",))
+        assert mock_get.call_args.kwargs["url"].endswith("/export/contract?no_signed")
+        assert mock_get.call_args.kwargs["stream"] is True
+        assert path.read_bytes() == b"id,client\r\n1,client 1\r\n"
+        assert "contracts exported" in capsys.readouterr().out
+
+    def test_export_file_interrupted(self, mocker, capsys, tmp_path):
+        path = tmp_path / "contracts.csv"
+        mocker.patch("cli_app.controller.APIBase._get_token", return_value="fake token")
+        mock_response = MagicMock(status_code=200)
+        mock_response.iter_content.side_effect = requests.exceptions.ChunkedEncodingError()
+        mock_get = mocker.patch("cli_app.controller.APIBase.http.get")
+        mock_get.return_value.__enter__.return_value = mock_response
+
+        Transfer().export_file("contract", str(path))
+        assert not path.exists()
+        assert "Export interrupted" in capsys.readouterr().out
+
+
+class TestStats:
+
+    def test_show_prints_server_numbers(self, mocker, capsys):
+        mocker.patch("cli_app.controller.APIBase._local_session", return_value={"role": "gestion", "id": 1})
+        request_api = mocker.patch("cli_app.controller.Stats.request_api", return_value={
+            "commercials": [{"id": 2, "name": "collab 1", "outstanding": 500, "debtor_contracts": 1,
+                             "unsigned_contracts": 1, "events_without_support": 0}],
+            "supports": [{"id": 3, "name": "support 1", "upcoming_events": 4}],
+            "totals": {"outstanding": 500, "debtor_contracts": 1, "unsigned_contracts": 1,
+                       "events_without_support": 0, "upcoming_events": 4}
+        })
+        Stats().show()
+
+        request_api.assert_called_once_with("/stats")
+        output = capsys.readouterr().out
+        assert "collab 1" in output
+        assert "support 1" in output
+        assert "Outstanding: 500" in output
@@ -2,6 +2,8 @@ import datetime
 
 import pytest
 from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import NullPool
 
 from server.db_manager import DBManager
 from server.models import Collaborator, Client, Contract, Event
@@ -99,3 +101,50 @@ class TestDatabase:
             session.add(event)
             stmt = select(Event).where(Event.id == 1)
             assert session.scalar(stmt) == event
+
+
+class TestRegistry:
+
+    @pytest.fixture(autouse=True)
+    def empty_registry(self, monkeypatch):
+        monkeypatch.setattr(DBManager, "engines", {})
+        monkeypatch.setattr(DBManager, "session_factories", {})
+
+    def test_no_engine_created_at_init(self, mocker):
+        hasher = mocker.patch("server.db_manager.PasswordHasher")
+        DBManager()
+        assert DBManager.engines == {}
+        hasher.assert_not_called()
+
+    def test_session_factory_shared_between_managers(self):
+        assert DBManager().get_session() is DBManager().get_session()
+        assert DBManager().get_async_session() is DBManager().get_async_session()
+        assert len(DBManager.engines) == 2
+
+    def test_pool_configured_from_config(self, mocker):
+        mocker.patch("server.db_manager.config.DB_POOL_SIZE", 3)
+        mocker.patch("server.db_manager.config.DB_MAX_OVERFLOW", 7)
+        engine = DBManager().engine
+        assert engine.pool.size() == 3
+        assert engine.pool._max_overflow == 7
+
+    def test_null_pool_for_pgbouncer(self, mocker):
+        mocker.patch("server.db_manager.config.DB_NULL_POOL", True)
+        assert isinstance(DBManager().async_engine.pool, NullPool)
+
+    def test_create_indexes_concurrently(self, mocker):
+        engine = mocker.patch.object(DBManager, "_get_engine").return_value
+        engine.dialect = postgresql.dialect()
+        conn = engine.connect.return_value.execution_options.return_value.__enter__.return_value
+        conn.scalars.return_value.all.return_value = ["ix_event_no_support"]
+        DBManager().create_indexes()
+        statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+        assert "DROP INDEX CONCURRENTLY ix_event_no_support" in statements
+        assert (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_client_unassigned ON client (id) WHERE commercial_id IS NULL"
+            in statements
+        )
+        assert statements[0] == "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+        assert all(
+            statement.startswith(("CREATE INDEX CONCURRENTLY", "DROP INDEX CONCURRENTLY")) for statement in statements[1:]
+        )
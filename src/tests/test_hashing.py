@@ -0,0 +1,38 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import argon2
+import pytest
+
+from server.hashing import hash_password, verify_password
+
+
+class TestHashing:
+
+    def test_hash_and_verify_password(self):
+        hashed = asyncio.run(hash_password("123456"))
+        assert hashed != "123456"
+        assert asyncio.run(verify_password(hashed, "123456"))
+
+    def test_verify_wrong_password(self):
+        hashed = asyncio.run(hash_password("123456"))
+        with pytest.raises(argon2.exceptions.VerificationError):
+            asyncio.run(verify_password(hashed, "654321"))
+
+    def test_hashes_run_concurrently(self, mocker):
+        # each hash waits for a second one to start: hashes run one after the other break the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def hash_when_overlapping(password):
+            barrier.wait()
+            return argon2.PasswordHasher().hash(password)
+
+        mocker.patch("server.hashing.ph", mocker.Mock(hash=hash_when_overlapping))
+        mocker.patch("server.hashing.executor", ThreadPoolExecutor(max_workers=2))
+
+        async def hash_many():
+            return await asyncio.gather(*[hash_password(f"password{i}") for i in range(4)])
+
+        assert len(set(asyncio.run(hash_many()))) == 4
+        assert not barrier.broken
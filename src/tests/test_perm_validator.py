@@ -1,6 +1,8 @@
+import datetime
+
 import pytest
 
-from server.permissions import check_permission_and_data
+from server.permissions import check_permission_and_data, to_db_values
 
 
 class Contract:
@@ -135,3 +137,11 @@ class TestPremissionsAndValidator:
             role="gestion"
         )
         assert res == {"error": "Invalid value for field: password"}
+
+    def test_date_strings_converted_for_database(self):
+        res = to_db_values({"date": "02/01/2025", "event_start": "25/01/2026 15:30", "note": "test"})
+        assert res == {
+            "date": datetime.date(2025, 1, 2),
+            "event_start": datetime.datetime(2026, 1, 25, 15, 30),
+            "note": "test"
+        }
@@ -0,0 +1,38 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from sqlalchemy.dialects import postgresql
+
+from server.rollups import update_balances, rebuild_statements
+
+
+class TestRollups:
+
+    def test_update_balances_one_statement_per_balance(self):
+        session = AsyncMock()
+        asyncio.run(update_balances(
+            session,
+            added=[{"client_id": 1, "commercial_id": 3, "total_cost": 1500, "remaining_to_pay": 100}],
+            removed=[{"client_id": 1, "commercial_id": 2, "total_cost": 1500, "remaining_to_pay": 100}]
+        ))
+        # the client balance is unchanged, only the commercials are updated
+        assert session.execute.await_count == 1
+        statement = session.execute.await_args.args[0].compile(dialect=postgresql.dialect())
+        assert "ON CONFLICT (commercial_id) DO UPDATE" in str(statement)
+        assert [value for key, value in statement.params.items() if key.startswith("total_cost")] == [-1500, 1500]
+
+    def test_update_balances_skips_unassigned_contracts(self):
+        session = AsyncMock()
+        asyncio.run(update_balances(
+            session,
+            added=[{"client_id": 1, "commercial_id": None, "total_cost": 10, "remaining_to_pay": 0}]
+        ))
+        statement = str(session.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+        assert session.execute.await_count == 1
+        assert "INSERT INTO client_balance" in statement
+
+    def test_rebuild_statements(self):
+        statements = [str(statement.compile(dialect=postgresql.dialect())) for statement in rebuild_statements()]
+        assert statements[0] == "DELETE FROM commercial_balance"
+        assert statements[1].startswith("INSERT INTO commercial_balance (commercial_id, contracts")
+        assert "GROUP BY contract.client_id" in statements[3]
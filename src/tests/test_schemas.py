@@ -0,0 +1,58 @@
+import pytest
+
+from shared.schemas import validate, validate_many, parse_input, SCHEMAS, PERMISSIONS
+from cli_app.views import ViewInput
+
+
+class TestSchemas:
+
+    def test_schemas_compiled_for_each_role(self):
+        assert set(SCHEMAS) == {(table, role) for table, roles in PERMISSIONS.items() for role in roles}
+
+    def test_validate_many(self):
+        records = [
+            {"total_cost": 1000, "status": True},
+            {"total_cost": True},
+            {"event_title": "not allowed"},
+            {}
+        ]
+        assert validate_many("contract", "commercial", records) == [
+            {"total_cost": 1000, "status": True},
+            {"error": "Invalid value for field: total_cost"},
+            {"error": "Invalid field: event_title"},
+            None
+        ]
+        assert validate_many("contract", "support", records) == [None] * 4
+
+    def test_values_longer_than_the_column_rejected(self):
+        assert validate("client", "commercial", {"name": "n" * 51}) == {"error": "Invalid value for field: name"}
+        assert validate("client", "commercial", {"phone": "1" * 21}) == {"error": "Invalid value for field: phone"}
+        assert validate("client", "commercial", {"name": "n" * 50}) == {"name": "n" * 50}
+
+    def test_validate_unknown_role(self):
+        assert validate("collaborator", "commercial", {"name": "test"}) is None
+
+    @pytest.mark.parametrize("field, text, value", [
+        ("attendees", "120", 120),
+        ("status", "1", True),
+        ("role_id", "2", 2),
+        ("event_start", "25/01/2026 15:30", "25/01/2026 15:30"),
+        ("note", "free text", "free text")
+    ])
+    def test_cli_input_parsed_with_api_rules(self, field, text, value):
+        assert parse_input(field, text) == value
+        # the parsed value is accepted by the API
+        assert ViewInput().check_input(field, text) == value
+
+    @pytest.mark.parametrize("field, text", [
+        ("attendees", "-1"),
+        ("status", "yes"),
+        ("role_id", "4"),
+        ("email", "test.test.com"),
+        ("date", "1-1-2011"),
+        ("password", "123")
+    ])
+    def test_cli_invalid_input(self, field, text):
+        with pytest.raises(ValueError):
+            parse_input(field, text)
+        assert ViewInput().check_input(field, text) is None
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from server.models import Client
+from server.streaming import ndjson_response, csv_response
+
+
+def failing_request(rows):
+    # the stream yields the rows then the connection to the database is lost
+    async def scalars():
+        for row in rows:
+            yield row
+        raise OperationalError("SELECT", {}, Exception("connection lost"))
+
+    async def partitions():
+        async for row in scalars():
+            yield [(row,)]
+
+    async def stream(stmt):
+        result = MagicMock()
+        result.scalars = scalars
+        result.partitions = partitions
+        result.keys.return_value = ["id"]
+        return result
+
+    @asynccontextmanager
+    async def begin():
+        session = MagicMock()
+        session.stream = stream
+        yield session
+
+    request = MagicMock()
+    request.state.db.begin = begin
+    return request
+
+
+async def read_body(response) -> list[str]:
+    return [chunk async for chunk in response.body_iterator]
+
+
+class TestStreaming:
+
+    def test_ndjson_ends_with_error_record(self, mocker):
+        capture = mocker.patch("server.streaming.capture_exception")
+        response = ndjson_response(failing_request([1, 2]), select(Client), lambda row: {"id": row})
+
+        lines = asyncio.run(read_body(response))
+        assert [json.loads(line) for line in lines] == [{"id": 1}, {"id": 2}, {"error": "Internal error"}]
+        capture.assert_called_once()
+
+    def test_csv_aborted_on_error(self, mocker):
+        capture = mocker.patch("server.streaming.capture_exception")
+        response = csv_response(failing_request([1]), select(Client), "clients.csv")
+
+        with pytest.raises(OperationalError):
+            asyncio.run(read_body(response))
+        capture.assert_called_once()
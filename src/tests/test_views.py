@@ -0,0 +1,106 @@
+import pytest
+
+from cli_app.views import ViewSelect, read_key
+
+
+@pytest.fixture
+def first_page():
+    return {
+        "clients": [{"id": 1, "name": "client 1"}],
+        "next_cursor": 1
+    }
+
+
+class TestViewSelect:
+
+    def test_next_page_loaded_on_scroll(self, mocker, first_page):
+        mocker.patch("cli_app.views.getch", side_effect=["w", "\n"])
+        load_page = mocker.Mock(return_value={"clients": [{"id": 2, "name": "client 2"}], "next_cursor": None})
+
+        select = ViewSelect(first_page, msg="test", select=True, load_page=load_page)
+        assert select.live_show() == 2
+        load_page.assert_called_once_with(1)
+        assert len(first_page["clients"]) == 2
+
+    def test_no_page_loaded_without_scroll(self, mocker, first_page):
+        mocker.patch("cli_app.views.getch", side_effect=["\n"])
+        load_page = mocker.Mock()
+
+        select = ViewSelect(first_page, msg="test", select=True, load_page=load_page)
+        assert select.live_show() == 1
+        load_page.assert_not_called()
+
+    def test_only_viewport_rows_rendered(self, mocker):
+        data = {"clients": [{"id": idx, "name": f"client {idx}"} for idx in range(1, 5001)], "next_cursor": None}
+        select = ViewSelect(data, msg="test", select=True)
+        mocker.patch.object(select, "_viewport_height", return_value=20)
+        select.pointer = 4999
+        table = select._create_table()
+        assert table.row_count == 20
+        assert select.offset == 4980
+
+    def test_navigation_keys(self, mocker):
+        data = {"clients": [{"id": idx, "name": f"client {idx}"} for idx in range(1, 101)], "next_cursor": None}
+        mocker.patch("cli_app.views.getch", side_effect=["\x1b", "[", "6", "~", "\x1b", "[", "F", "g", "\n"])
+        mocker.patch("cli_app.views.key_pending", return_value=True)
+        select = ViewSelect(data, msg="test", select=True)
+        mocker.patch.object(select, "_viewport_height", return_value=10)
+        mocker.patch.object(select.console, "input", return_value="42")
+        assert select.live_show() == 42
+
+    def test_page_down_moves_one_viewport(self, mocker):
+        data = {"clients": [{"id": idx, "name": f"client {idx}"} for idx in range(1, 101)], "next_cursor": None}
+        mocker.patch("cli_app.views.getch", side_effect=["\x1b", "[", "6", "~", "\n"])
+        mocker.patch("cli_app.views.key_pending", return_value=True)
+        select = ViewSelect(data, msg="test", select=True)
+        mocker.patch.object(select, "_viewport_height", return_value=10)
+        assert select.live_show() == 11
+
+    def test_search_filters_rows(self, mocker):
+        data = {"clients": [{"id": idx, "name": f"client {idx}", "company": "Acme" if idx % 2 else "Globex"}
+                            for idx in range(1, 101)], "next_cursor": None}
+        mocker.patch("cli_app.views.getch", side_effect=["/", "g", "l", "o", "\n", "w", "\n"])
+        select = ViewSelect(data, msg="test", select=True)
+        assert select.live_show() == 4
+        assert select.query == "glo"
+        assert len(select.visible) == 50
+
+    def test_search_words_intersect(self, mocker):
+        data = {"clients": [{"id": 1, "name": "Jean Dupont"}, {"id": 2, "name": "Jean Martin"}], "next_cursor": None}
+        select = ViewSelect(data, msg="test", select=True)
+        select.query = "mar je"
+        select._refresh()
+        assert select.visible == [1]
+
+    def test_sort_columns(self, mocker):
+        data = {"clients": [{"id": 9, "name": "b"}, {"id": 10, "name": "a"}, {"id": 2, "name": "c"}], "next_cursor": None}
+        select = ViewSelect(data, msg="test", select=True)
+        select._next_sort()
+        assert [select.cells[idx][0] for idx in select.visible] == ["2", "9", "10"]
+        select._next_sort()
+        assert [select.cells[idx][0] for idx in select.visible] == ["10", "9", "2"]
+        select._next_sort()
+        assert [select.cells[idx][1] for idx in select.visible] == ["a", "b", "c"]
+
+    def test_search_escape_clears_filter(self, mocker):
+        data = {"clients": [{"id": idx, "name": f"client {idx}"} for idx in range(1, 11)], "next_cursor": None}
+        # a lone Esc: nothing follows it, no second read
+        mocker.patch("cli_app.views.getch", side_effect=["/", "7", "\x1b", "\n"])
+        mocker.patch("cli_app.views.key_pending", return_value=False)
+        select = ViewSelect(data, msg="test", select=True)
+        assert select.live_show() == 1
+        assert len(select.visible) == 10
+
+
+class TestReadKey:
+
+    def test_lone_escape_does_not_wait_for_a_second_key(self, mocker):
+        getch = mocker.patch("cli_app.views.getch", side_effect=["\x1b"])
+        mocker.patch("cli_app.views.wait_readable", return_value=([], [], []))
+        assert read_key() == "escape"
+        assert getch.call_count == 1
+
+    def test_escape_sequence_read_when_pending(self, mocker):
+        mocker.patch("cli_app.views.getch", side_effect=["\x1b", "[", "5", "~"])
+        mocker.patch("cli_app.views.wait_readable", return_value=([object()], [], []))
+        assert read_key() == "page_up"